@@ -0,0 +1,306 @@
+"""
+Benchmark suite for the hot paths of the simulation.
+
+    python benchmark.py --out bench-before.json
+    python benchmark.py --out bench-after.json
+    python benchmark.py --compare bench-before.json bench-after.json
+
+Every case runs on seeded systems of N = 3, 100, 1k and 10k bodies (see
+--sizes), without a window: the draw case renders to an offscreen
+pygame.Surface. Each case is timed call by call until it has run
+--repeats times or used --budget seconds, whichever comes first (but at
+least MIN_SAMPLES times), and reports calls per second, the latency
+percentiles and the peak memory allocated during one call (measured with
+tracemalloc in a separate run, so the tracing does not slow down the timed
+calls). The results are written as JSON, together with the settings and
+the git revision they were measured on, and --compare prints the change of
+every case between two result files.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+
+# The draw case only needs an offscreen surface, never open a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from globals import *
+from func import *
+from render import *
+from initial_conditions import poisson_disk
+
+MIN_SAMPLES = 3
+# create_bodies places bodies of radius 15-30 without overlaps, more than
+# this many do not fit on the screen
+CREATE_BODIES_MAX = 100
+
+
+def bench_system(n, seed):
+    """
+    Builds a seeded system of n bodies spread over the screen.
+
+    Like create_bodies, no two bodies overlap at the start: every body gets
+    its own cell of a grid covering the screen and a random place and
+    radius inside it. The masses follow the radii as in create_bodies.
+    """
+    rng = np.random.default_rng([seed, n])
+    cols = max(1, math.ceil(math.sqrt(n * screen_width / screen_height)))
+    rows = math.ceil(n / cols)
+    cell_w = screen_width / cols
+    cell_h = screen_height / rows
+
+    max_radius = min(30.0, 0.4 * min(cell_w, cell_h))
+    rad = rng.uniform(0.5, 1.0, n) * max_radius
+    cell = rng.permutation(cols * rows)[:n]
+    x = (cell % cols) * cell_w + rad + rng.uniform(0, 1, n) * (cell_w - 2 * rad)
+    y = (cell // cols) * cell_h + rad + rng.uniform(0, 1, n) * (cell_h - 2 * rad)
+    pos = np.stack([x, y], axis=1)
+
+    b = Particles(n)
+    b.load({
+        "pos": pos,
+        "prev_pos": pos,
+        "vel": rng.normal(0, 20, (n, 2)),
+        "mass": MIN_MASS + (MAX_MASS - MIN_MASS) * rad / max_radius,
+        "rad": rad,
+        "color": rng.integers(64, 256, (n, 3)),
+    })
+    return b
+
+
+class Case:
+    """
+    One benchmarked function.
+
+    setup(n, seed) builds the state, before(state) runs untimed before every
+    call and call(state) is the timed part.
+    """
+
+    def __init__(self, name, setup, call, before=None, max_n=None):
+        self.name = name
+        self.setup = setup
+        self.call = call
+        self.before = before
+        self.max_n = max_n
+
+
+def _physics_setup(n, seed):
+    return {"bodies": bench_system(n, seed), "fixed": set()}
+
+
+def _create_setup(n, seed):
+    random.seed(seed)
+    return {"n": n}
+
+
+def _poisson_setup(n, seed):
+    # Radii covering about a fifth of the screen at every size
+    max_radius = min(30.0, math.sqrt(0.2 * screen_width * screen_height / (math.pi * n)) * 1.25)
+    return {"n": n, "radii": (max_radius / 2, max_radius), "seed": seed}
+
+
+def _collision_before(state):
+    # Move the bodies first, as func.step does
+    state["bodies"].update_pos()
+
+
+def _collision_call(state):
+    state["fixed"] = univ_collision(state["bodies"], state["fixed"])
+
+
+def _step_call(state):
+    state["fixed"] = step(state["bodies"], state["fixed"])
+
+
+def _draw_setup(n, seed):
+    # Full, straight trails along the velocities, built directly so the
+    # picture does not depend on the collisions of the warm-up steps
+    state = _physics_setup(n, seed)
+    b = state["bodies"]
+    end = b.pos.copy()
+    for k in range(b.trail_length, 0, -1):
+        b.pos[:] = end - b.vel * (k * TIMESTEP)
+        b.push_trails()
+    b.pos[:] = end
+
+    pygame.init()
+    state["surface"] = pygame.Surface((screen_width, screen_height))
+    return state
+
+
+def _draw_before(state):
+    state["surface"].fill(BLACK)
+
+
+def _draw_call(state):
+    draw_bodies(state["bodies"], (0, 0), 1, screen=state["surface"])
+
+
+CASES = (
+    Case("create_bodies", _create_setup, lambda s: create_bodies(s["n"]), max_n=CREATE_BODIES_MAX),
+    Case("poisson_disk", _poisson_setup, lambda s: poisson_disk(s["n"], *s["radii"], seed=s["seed"])),
+    Case("gravity", _physics_setup, lambda s: gravity_accelerations(s["bodies"].pos, s["bodies"].mass)),
+    Case("calc_forces", _physics_setup, lambda s: calc_forces(s["bodies"])),
+    Case("univ_collision", _physics_setup, _collision_call, before=_collision_before),
+    Case("update_pos", _physics_setup, lambda s: s["bodies"].update_pos()),
+    Case("step", _physics_setup, _step_call),
+    Case("draw", _draw_setup, _draw_call, before=_draw_before),
+)
+
+
+def run_case(case, n, seed, repeats, budget):
+    """
+    Times one case at one size.
+
+    Returns:
+        dict: The result entry, None if the case does not run at this size.
+    """
+    if case.max_n is not None and n > case.max_n:
+        return None
+
+    state = case.setup(n, seed)
+    times = []
+    spent = 0.0
+    while len(times) < repeats and (len(times) < MIN_SAMPLES or spent < budget):
+        if case.before is not None:
+            case.before(state)
+        start = time.perf_counter()
+        case.call(state)
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        spent += elapsed
+
+    # Peak memory of one more call, on its own because tracing is slow
+    if case.before is not None:
+        case.before(state)
+    tracemalloc.start()
+    case.call(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = np.array(times) * 1000
+    return {
+        "case": case.name,
+        "n": n,
+        "seed": seed,
+        "samples": len(times),
+        "mean_ms": float(ms.mean()),
+        "min_ms": float(ms.min()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "per_second": float(1000 / ms.mean()),
+        "peak_kib": peak / 1024,
+    }
+
+
+def environment():
+    """
+    The revision, versions and settings the results were measured with.
+    """
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        revision = None
+
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "GRAVITY_ENABLED": GRAVITY_ENABLED,
+            "FORCE_BACKEND": FORCE_BACKEND,
+            "INTEGRATOR": INTEGRATOR,
+            "BOUNDARY_MODE": BOUNDARY_MODE,
+            "PHYSICS_BACKEND": PHYSICS_BACKEND,
+            "TRAIL_LENGHT": TRAIL_LENGHT,
+            "TIMESTEP": TIMESTEP,
+        },
+    }
+
+
+def run_suite(sizes=(3, 100, 1000, 10000), cases=None, seed=0, repeats=50, budget=2.0):
+    """
+    Runs the selected cases (all by default) at every size and prints one
+    line per result.
+
+    Returns:
+        dict: {"environment": ..., "results": [...]}, ready for json.dump.
+    """
+    selected = [c for c in CASES if cases is None or c.name in cases]
+    results = []
+
+    print(f"{'case':15} {'N':>6} {'calls/s':>10} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'peak KiB':>10}")
+    for case in selected:
+        for n in sizes:
+            r = run_case(case, n, seed, repeats, budget)
+            if r is None:
+                continue
+            results.append(r)
+            print(
+                f"{r['case']:15} {n:6d} {r['per_second']:10.1f} {r['p50_ms']:10.3f}"
+                f" {r['p90_ms']:10.3f} {r['p99_ms']:10.3f} {r['peak_kib']:10.1f}"
+            )
+            sys.stdout.flush()
+
+    return {"environment": environment(), "results": results}
+
+
+def compare(old_path, new_path):
+    """
+    Prints the median latency of every case found in both result files and
+    its change (below 1.00x is faster).
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    before = {(r["case"], r["n"]): r for r in old["results"]}
+    print(f"{old['environment']['revision']} -> {new['environment']['revision']}")
+    print(f"{'case':15} {'N':>6} {'old p50 ms':>11} {'new p50 ms':>11} {'ratio':>7} {'peak KiB':>17}")
+    for r in new["results"]:
+        o = before.get((r["case"], r["n"]))
+        if o is None:
+            continue
+        ratio = r["p50_ms"] / o["p50_ms"] if o["p50_ms"] > 0 else float("inf")
+        print(
+            f"{r['case']:15} {r['n']:6d} {o['p50_ms']:11.3f} {r['p50_ms']:11.3f} {ratio:6.2f}x"
+            f" {o['peak_kib']:8.0f}->{r['peak_kib']:<8.0f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 100, 1000, 10000], help="numbers of bodies")
+    parser.add_argument("--cases", nargs="+", default=None, choices=[c.name for c in CASES], help="cases to run (default all)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the benchmark systems")
+    parser.add_argument("--repeats", type=int, default=50, help="most timed calls per case and size")
+    parser.add_argument("--budget", type=float, default=2.0, help="seconds of timed calls per case and size")
+    parser.add_argument("--out", default=None, help="JSON file the results are written to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    suite = run_suite(args.sizes, args.cases, args.seed, args.repeats, args.budget)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(suite, f, indent=1)
+        print("Results written to", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,237 +9,116 @@ def point_dist(x1, y1, x2, y2):
     distance = math.sqrt(delta_x + delta_y)
     return distance
 
-class CircleHandle:
-    def __init__(self):
-        pass  # No attributes initialized here
-
-    def draw(self, surface, center, radius, handle_offset, handle_radius, handle_color, line_color, line_thickness):
-        self.center = center
-        self.radius = radius
-        self.handle_offset = handle_offset  # Distance of handle from center
-        self.handle_radius = handle_radius
-        self.handle_color = handle_color
-        self.line_color = line_color
-        self.line_thickness = line_thickness
-
-        # Calculate handle position based on offset and direction (optional)
-        handle_direction = (1, 0)  # Adjust for desired direction (e.g., up: (0, -1))
-        handle_pos = (
-            self.center[0] + handle_direction[0] * (self.radius + self.handle_offset),
-            self.center[1] + handle_direction[1] * (self.radius + self.handle_offset)
-        )
-
-        # Draw handle circle and connecting line
-        pygame.draw.circle(surface, handle_color, handle_pos, handle_radius)
-        pygame.draw.line(
-            surface, line_color, self.center, handle_pos, line_thickness
-        )
-
-    def is_clicked(self, mouse_pos):
-        # Check collision with handle circle (consider handle_radius)
-        handle_pos = (
-            self.center[0] + self.handle_direction[0] * (self.radius + self.handle_offset),
-            self.center[1] + self.handle_direction[1] * (self.radius + self.handle_offset)
-        )
-        distance = ((mouse_pos[0] - handle_pos[0])**2 + (mouse_pos[1] - handle_pos[1])**2)**0.5
-        return distance <= self.handle_radius
+class Body:
+    """
+    Thin view over one row of a Particles store.
 
+    The simulation state lives in the store arrays; a Body only remembers its
+    store and index, and exposes the row through the attribute names the
+    mouse-drag and Tk editing code already use.
+    """
 
+    def __init__(self, store, index) -> None:
+        self.store = store
+        self.index = index
 
-class Body:
-    coll_distance = {}  # first the index, then the distance
-    skip = False
-    mass = 0
-    vx = 0
-    vy = 0
-    border = False
-    border_cnt = 0
-    colliding = 0
-    MAX_HISTORY_SIZE = TRAIL_LENGHT
-    circle_history = []
-    handle = CircleHandle()
-
-    def add_to_history(self, new_value):
-        """
-        This function adds a new value to the circle_history list,
-        keeping only the most recent MAX_HISTORY_SIZE elements.
-
-        Args:
-            circle_history: A list containing the circle history.
-            new_value: The new value to add to the history.
-
-        Returns:
-            The updated circle_history list.
-        """
-        self.circle_history.append(new_value)  # Add the new value
-        tmp = self.circle_history[-self.MAX_HISTORY_SIZE:]  # Return only the most recent elements
-        self.circle_history = tmp
+    @property
+    def x(self):
+        return self.store.pos[self.index, 0]
 
+    @x.setter
+    def x(self, value):
+        self.store.pos[self.index, 0] = value
+        self.store.prev_pos[self.index, 0] = value
 
-    def clear_trajectory(self):
-        #print("Clearing trjectory")
-        self.circle_history = []
-        
+    @property
+    def y(self):
+        return self.store.pos[self.index, 1]
 
-    def accel(self, ax, ay):
-        if (self.colliding == 0):
-            self.vx += ax
-            self.vy += ay
-        else:
-            #print("Colliding, skipping")
-            pass
+    @y.setter
+    def y(self, value):
+        self.store.pos[self.index, 1] = value
+        self.store.prev_pos[self.index, 1] = value
 
-    def __init__(self, radius, x, y, color=WHITE) -> None:
-        
-        self.radius = radius
-        self.rad = radius
-        self.color = color
+    @property
+    def vx(self):
+        return self.store.vel[self.index, 0]
 
-        if x < radius:
-            x = radius
+    @vx.setter
+    def vx(self, value):
+        self.store.vel[self.index, 0] = value
 
-        if y < radius:
-            y = radius
+    @property
+    def vy(self):
+        return self.store.vel[self.index, 1]
 
-        if x > screen_width:
-            x = screen_width
+    @vy.setter
+    def vy(self, value):
+        self.store.vel[self.index, 1] = value
 
-        if y > screen_height:
-            y = screen_height
+    @property
+    def mass(self):
+        return self.store.mass[self.index]
 
-        self.x = x
-        self.y = y
+    @mass.setter
+    def mass(self, value):
+        self.store.mass[self.index] = value
 
-    def look_result(self, times):
-        self.border_cnt = times
+    @property
+    def rad(self):
+        return self.store.rad[self.index]
 
-    def zoom_line(self, points, factor):
-        """
-        Zooms a line defined by a list of points up or down by a factor, maintaining original position.
+    @rad.setter
+    def rad(self, value):
+        self.store.rad[self.index] = value
 
-        Args:
-            points: A list of tuples representing the (x, y) coordinates of the line points.
-            factor: A float value representing the zoom factor (positive for zoom in, negative for zoom out).
+    # radius and rad used to be two separate copies, now they are the same value
+    radius = rad
 
-        Returns:
-            A new list of points with the zoomed coordinates.
-        """
-        if (len(points) < 1):
-            return
-        
-        # Calculate the average of all x and y coordinates
-        average_x = sum(x for x, _ in points) / len(points)
-        average_y = sum(y for _, y in points) / len(points)
-
-        zoomed_points = []
-        for point in points:
-            x, y = point
-            # Subtract the average to center the line at origin during zoom
-            centered_x = x - average_x
-            centered_y = y - average_y
-            # Apply zoom factor to the centered coordinates
-            zoomed_x = centered_x * factor
-            zoomed_y = centered_y * factor
-            # Add the average back to maintain original position
-            zoomed_point = (zoomed_x + average_x, zoomed_y + average_y)
-            zoomed_points.append(zoomed_point)
-        return zoomed_points
-
-    def draw(self, off, zoom):
-        pygame.draw.circle(screen, self.color, (self.x+off[0], self.y+off[1]), self.radius*zoom)
-        
-        scaled_history = self.zoom_line(self.circle_history, zoom)
-        if(len(self.circle_history) > 1):
-            for i in range(len(scaled_history)-1):
-                trail_c = self.color
-                
-                x = scaled_history[i][0]+(off[0]*zoom)
-                y = scaled_history[i][1]+(off[1]*zoom)
-                
-                nx = scaled_history[i+1][0]+(off[0]*zoom)
-                ny = scaled_history[i+1][1]+(off[1]*zoom)
-                
-                if(point_dist(x, y, self.x+off[0], self.y+off[1]) < self.radius*zoom):
-                    trail_c = (70, 70, 70)
-                    
-                pygame.draw.line(screen, trail_c, (x, y), (nx, ny), 1)
-        
-        text = (
-            "vx"
-            + f"{self.vx:.1f}"
-            + " vy"
-            + f"{self.vy:.1f}"
-        )
-        
+    @property
+    def color(self):
+        return tuple(int(c) for c in self.store.color[self.index])
 
+    @color.setter
+    def color(self, value):
+        self.store.color[self.index] = value
 
-        text_surface = font.render(text, True, RED)
-        screen.blit(text_surface, (self.x+off[0], self.y+off[1]))
+    @property
+    def colliding(self):
+        return self.store.colliding[self.index]
 
-        if self.border_cnt > 0:
-            self.border_cnt -= 1
-            ##print("x,y", self.x, self.y)
-            # input()
+    @colliding.setter
+    def colliding(self, value):
+        self.store.colliding[self.index] = value
 
-    def skip_update(self):
-        self.skip = True
+    @property
+    def border_cnt(self):
+        return self.store.border_cnt[self.index]
 
-    def step_back(self):
-        self.x = self.old_x
-        self.y = self.old_y
+    @border_cnt.setter
+    def border_cnt(self, value):
+        self.store.border_cnt[self.index] = value
 
-    def update_pos(self):
-        if self.skip == True:
-            self.skip = False
-            return
+    @property
+    def circle_history(self):
+        # View of the trail in the store, oldest point first
+        return self.store.trail_points(self.index)
 
-        b = self
+    def clear_trajectory(self):
+        #print("Clearing trjectory")
+        self.store.clear_trajectory(self.index)
+        
 
-        if len(self.coll_distance.keys()) > 0:
-            # ##print("WARNING THIS OBJECT COLLIDED")
+    def accel(self, ax, ay):
+        if (self.colliding == 0):
+            self.vx += ax
+            self.vy += ay
+        else:
+            #print("Colliding, skipping")
             pass
 
-        self.old_x = self.x
-        self.old_y = self.y
+    def look_result(self, times):
+        self.border_cnt = times
 
-        mypos = (self.x, self.y)
-        #print("center", mypos, "opposite", opposite)
-        self.add_to_history(mypos)
-        
-        b.x += b.vx * TIMESTEP
-        b.y += b.vy * TIMESTEP
-
-        if(UNIV_BORDERS):
-            if b.x > screen_width - b.rad:
-                ##print("X COLLISION", b.x)
-                b.x = (screen_width - b.rad) - (b.x - (screen_width - b.rad))
-                b.vx = -b.vx
-
-                # input()
-                self.look_result(3)
-            if b.x < b.rad:
-                ##print("X COLLISION", b.x)
-                b.x = b.rad + abs(b.x - b.rad)
-                b.vx = -b.vx
-
-                # input()
-                self.look_result(3)
-            if b.y > screen_height - b.rad:
-                ##print("Y COLLISION", b.y)
-                b.y = (screen_height - b.rad) - (b.y - (screen_height - b.rad))
-                b.vy = -b.vy
-
-                # input()
-                self.look_result(3)
-            if b.y < b.rad:
-                ##print("Y COLLISION", b.y)
-                b.y = b.rad + (b.rad - b.y)
-                b.vy = -b.vy
-
-                # input()
-                self.look_result(3)
-
-    def look_newpos(self):
-        if self.border:
-            # input()
-            self.border = False
+    def skip_update(self):
+        self.store.skip[self.index] = True
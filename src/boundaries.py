@@ -0,0 +1,75 @@
+"""
+Boundary conditions of the universe, selected with BOUNDARY_MODE.
+
+"reflect" bounces the bodies off the screen edges (the original
+UNIV_BORDERS behaviour), "periodic" wraps them around so the screen
+becomes a torus, and "open" leaves them alone and removes the ones that
+went farther than OPEN_CUTOFF past the edges.
+
+In periodic mode every pairwise interaction uses the minimum image
+convention: two bodies interact through the closest of the periodic copies
+of each other, so a body near the left edge attracts and collides with the
+ones near the right edge. Only that one image is counted, the gravity of a
+periodic system is the truncated sum, not an Ewald sum over every copy.
+"""
+from globals import *
+
+BOUNDARY_MODES = ("reflect", "periodic", "open")
+
+
+def periodic_box(mode=BOUNDARY_MODE):
+    """
+    Returns the (width, height) of the periodic box, None when the
+    boundaries are not periodic.
+    """
+    if mode not in BOUNDARY_MODES:
+        raise ValueError("Unknown boundary mode: " + str(mode))
+    if mode == "periodic":
+        return (float(screen_width), float(screen_height))
+    return None
+
+
+def minimum_image(d, length):
+    """
+    Maps the separations `d` along one axis of a periodic box of size
+    `length` to the nearest image, between -length / 2 and length / 2.
+    Works in place on arrays, and on plain floats.
+    """
+    if isinstance(d, np.ndarray):
+        d -= length * np.round(d / length)
+        return d
+    return math.remainder(d, length)
+
+
+def image_shift(d, box):
+    """
+    Multiples of the box size to subtract from the (N, 2) displacements
+    `d` to bring them back to the nearest image.
+    """
+    box = np.asarray(box)
+    return box * np.round(d / box)
+
+
+def pair_distances(pos, i, k, box=None):
+    """
+    Distances between the bodies i[j] and k[j], through the nearest image
+    when `box` is given.
+    """
+    dx = pos[i, 0] - pos[k, 0]
+    dy = pos[i, 1] - pos[k, 1]
+    if box is not None:
+        minimum_image(dx, box[0])
+        minimum_image(dy, box[1])
+    return np.hypot(dx, dy)
+
+
+def escaped(pos, cutoff=OPEN_CUTOFF):
+    """
+    Mask of the bodies more than `cutoff` pixels outside the screen (none
+    when cutoff is None).
+    """
+    if cutoff is None:
+        return np.zeros(len(pos), dtype=bool)
+    x = pos[:, 0]
+    y = pos[:, 1]
+    return (x < -cutoff) | (x > screen_width + cutoff) | (y < -cutoff) | (y > screen_height + cutoff)
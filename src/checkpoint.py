@@ -0,0 +1,152 @@
+"""
+Binary checkpoints of the simulation state.
+
+A checkpoint file is a small header followed by one contiguous array per
+body field:
+
+    magic (8 bytes) | header length (uint32) | JSON header | arrays
+
+The JSON header records the step count, the state of the `random` module,
+the touching pairs and, for every array, its dtype, shape and byte offset.
+Every array starts on an ARRAY_ALIGN boundary and is stored little endian,
+so load_checkpoint maps the arrays with np.memmap instead of reading and
+parsing the file. Restoring then costs one bulk copy per field, even for
+millions of bodies. The offsets are known before anything is written, so
+save_checkpoint streams the header and then the arrays one at a time,
+without building the whole file in memory.
+
+The trails are not saved, they start empty after a restore.
+"""
+import json
+import os
+
+from globals import *
+
+MAGIC = b"NBODYCK1"
+ARRAY_ALIGN = 64
+
+# Particles fields stored in a checkpoint (everything the physics reads)
+CHECKPOINT_FIELDS = ("pos", "prev_pos", "vel", "mass", "rad", "color", "colliding", "border_cnt", "skip", "level")
+
+
+def _align(offset):
+    return (offset + ARRAY_ALIGN - 1) // ARRAY_ALIGN * ARRAY_ALIGN
+
+
+def save_checkpoint(path, sim):
+    """
+    Writes the state of a Simulation to `path`.
+
+    The file is written next to `path` first and then renamed over it, so
+    an interrupted save never leaves a truncated checkpoint behind.
+    """
+    b = sim.bodies
+    arrays = {name: getattr(b, name) for name in CHECKPOINT_FIELDS}
+    arrays["touching"] = np.array(sorted(sim.touching), dtype=np.int64).reshape(-1, 2)
+
+    # The cached accelerations make the next verlet or block step identical
+    # to the one the saved run would have taken
+    cache = b.acc_cache
+    if cache is not None and np.array_equal(cache[0], b.pos) and np.array_equal(cache[1], b.mass):
+        arrays["acc"] = cache[2]
+
+    # Little endian copies are only made on big endian machines
+    arrays = {name: np.ascontiguousarray(a, dtype=a.dtype.newbyteorder("<")) for name, a in arrays.items()}
+
+    header = {
+        "bodies": len(b),
+        "step": sim.step_count,
+        "random_state": random.getstate(),
+        "arrays": {},
+    }
+
+    # The header holds the offsets, which depend on the header length: lay
+    # the arrays out after a generous estimate and pad the header up to it
+    layout = {name: {"dtype": a.dtype.str, "shape": a.shape} for name, a in arrays.items()}
+    start = _align(len(MAGIC) + 4 + len(json.dumps(dict(header, arrays=layout))) + 64 * len(arrays))
+    offset = start
+    for name, a in arrays.items():
+        header["arrays"][name] = dict(layout[name], offset=offset)
+        offset = _align(offset + a.nbytes)
+
+    encoded = json.dumps(header).encode()
+    encoded += b" " * (start - len(MAGIC) - 4 - len(encoded))
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(encoded)).tobytes())
+        f.write(encoded)
+        for name, a in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            a.tofile(f)
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """
+    A checkpoint file opened with load_checkpoint.
+
+    Attributes:
+        bodies: Number of bodies.
+        step: Step count of the saved simulation.
+        random_state: State of the `random` module when it was saved.
+        arrays: Dict of read-only memory-mapped arrays, by field name.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("%s is not a checkpoint file" % path)
+            size = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+            header = json.loads(f.read(size))
+
+        self.path = path
+        self.bodies = header["bodies"]
+        self.step = header["step"]
+        # JSON turned the tuples of getstate into lists
+        version, internal, gauss = header["random_state"]
+        self.random_state = (version, tuple(internal), gauss)
+
+        self.arrays = {}
+        for name, spec in header["arrays"].items():
+            shape = tuple(spec["shape"])
+            if np.prod(shape) == 0:
+                # mmap refuses empty mappings
+                self.arrays[name] = np.zeros(shape, dtype=spec["dtype"])
+            else:
+                self.arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r", offset=spec["offset"], shape=shape)
+
+    def touching(self):
+        return {(int(i), int(k)) for i, k in self.arrays["touching"]}
+
+    def restore(self, sim, restore_random=True):
+        """
+        Puts the saved state into a Simulation, replacing its bodies in
+        place (the renderer keeps the same Particles store).
+        """
+        b = sim.bodies
+        b.load({name: self.arrays[name] for name in CHECKPOINT_FIELDS})
+        if "acc" in self.arrays:
+            b.acc_cache = (b.pos.copy(), b.mass.copy(), np.array(self.arrays["acc"]))
+
+        sim.touching = self.touching()
+        sim.step_count = self.step
+        if restore_random:
+            random.setstate(self.random_state)
+        sim.publish()
+
+
+def load_checkpoint(path):
+    """
+    Opens a checkpoint file, see Checkpoint.
+
+    Raises:
+        ValueError: If the file is not a checkpoint.
+    """
+    return Checkpoint(path)
+
+
+def is_checkpoint(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
@@ -0,0 +1,278 @@
+"""
+Typed commands that change the simulation from outside the physics loop.
+
+The GUI thread and the pygame event handling never write into the bodies.
+They put commands on control_queue, and the loop running the physics drains
+the queue at one fixed point, between two steps, so a command never lands
+in the middle of a force evaluation. Every applied command can be recorded
+in a CommandLog, together with the step it was applied at, and replayed
+later on a fresh simulation for benchmarking.
+"""
+import json
+
+from globals import *
+from checkpoint import save_checkpoint, load_checkpoint
+
+
+class Command:
+    """
+    Base class of the commands. Subclasses store their arguments in
+    attributes named like the __init__ parameters listed in ARGS.
+    """
+
+    ARGS = ()
+
+    def apply(self, sim):
+        raise NotImplementedError
+
+    def args(self):
+        return [getattr(self, name) for name in self.ARGS]
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(repr(a) for a in self.args()))
+
+
+class SetProperty(Command):
+    """
+    Sets one attribute of a body (any of EDITABLE).
+    """
+
+    ARGS = ("index", "name", "value")
+    EDITABLE = ("x", "y", "vx", "vy", "mass", "radius")
+
+    def __init__(self, index, name, value):
+        if name not in self.EDITABLE:
+            raise ValueError("%s is not an editable body property" % name)
+        self.index = index
+        self.name = name
+        self.value = float(value)
+
+    def apply(self, sim):
+        body = sim.bodies[self.index]
+        setattr(body, self.name, self.value)
+        if self.name in ("x", "y"):
+            body.clear_trajectory()
+
+
+class AddBody(Command):
+    ARGS = ("x", "y", "radius", "mass", "vx", "vy", "color")
+
+    def __init__(self, x, y, radius, mass=0, vx=0, vy=0, color=WHITE):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.mass = mass
+        self.vx = vx
+        self.vy = vy
+        self.color = tuple(color)
+
+    def apply(self, sim):
+        sim.bodies.add(self.x, self.y, self.radius, self.mass, self.vx, self.vy, self.color)
+
+
+class RemoveBody(Command):
+    ARGS = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def apply(self, sim):
+        sim.bodies[self.index]  # raises IndexError for a body that does not exist
+        sim.bodies.remove(self.index)
+
+        # The bookkeeping of touching pairs refers to body indices
+        sim.touching = set()
+
+
+class ApplyImpulse(Command):
+    """
+    Changes the velocity of a body by (dvx, dvy), see Body.accel.
+    """
+
+    ARGS = ("index", "dvx", "dvy")
+
+    def __init__(self, index, dvx, dvy):
+        self.index = index
+        self.dvx = dvx
+        self.dvy = dvy
+
+    def apply(self, sim):
+        sim.bodies[self.index].accel(self.dvx, self.dvy)
+
+
+class ClearTrail(Command):
+    ARGS = ("index",)
+
+    def __init__(self, index):
+        self.index = index
+
+    def apply(self, sim):
+        sim.bodies[self.index].clear_trajectory()
+
+
+class Pause(Command):
+    def apply(self, sim):
+        sim.paused = True
+
+
+class Resume(Command):
+    def apply(self, sim):
+        sim.paused = False
+
+
+class StepN(Command):
+    """
+    Runs n physics steps right away, also while paused (single stepping).
+    """
+
+    ARGS = ("n",)
+
+    def __init__(self, n=1):
+        self.n = n
+
+    def apply(self, sim):
+        sim.step(self.n)
+
+
+class SaveCheckpoint(Command):
+    """
+    Writes the simulation state to a checkpoint file, see checkpoint.py.
+    """
+
+    ARGS = ("path",)
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+
+    def apply(self, sim):
+        save_checkpoint(self.path, sim)
+        print("Checkpoint written to", self.path)
+
+
+class LoadCheckpoint(Command):
+    """
+    Replaces the simulation state with the one in a checkpoint file.
+    """
+
+    ARGS = ("path",)
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+
+    def apply(self, sim):
+        load_checkpoint(self.path).restore(sim)
+        print("Checkpoint loaded from", self.path)
+
+
+COMMANDS = {
+    cls.__name__: cls
+    for cls in (SetProperty, AddBody, RemoveBody, ApplyImpulse, ClearTrail, Pause, Resume, StepN, SaveCheckpoint, LoadCheckpoint)
+}
+
+
+class CommandLog:
+    """
+    Applied commands with the step count they were applied at.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else []  # (step, command)
+
+    def record(self, step, command):
+        self.entries.append((step, command))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def save(self, path):
+        data = [[step, type(cmd).__name__, cmd.args()] for step, cmd in self.entries]
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls([(step, COMMANDS[name](*args)) for step, name, args in data])
+
+    def player(self):
+        """
+        Returns a LogPlayer that applies the logged commands to a simulation
+        as it reaches the recorded steps.
+        """
+        return LogPlayer(self)
+
+    def replay(self, sim, steps):
+        """
+        Runs `steps` physics steps on sim, applying every command before the
+        step it was originally applied at.
+        """
+        player = self.player()
+        for _ in range(steps):
+            player.apply_due(sim)
+            sim.step()
+
+
+class LogPlayer:
+    """
+    Cursor over a CommandLog used while replaying it.
+
+    StepN commands are skipped: the steps they ran are already counted in
+    the recorded step numbers, and the replaying loop runs them itself.
+    """
+
+    def __init__(self, log):
+        self.pending = [(step, cmd) for step, cmd in log.entries if not isinstance(cmd, StepN)]
+        self.next = 0
+
+    def apply_due(self, sim):
+        """
+        Applies the commands recorded at or before the current step of sim.
+        """
+        while self.next < len(self.pending) and self.pending[self.next][0] <= sim.step_count:
+            execute(sim, self.pending[self.next][1])
+            self.next += 1
+
+
+def execute(sim, command, log=None):
+    """
+    Applies one command, reporting the ones that do not fit the current
+    state (for example an index past the last body, or a checkpoint file
+    that cannot be read) instead of raising.
+
+    Returns:
+        bool: True if the command was applied.
+    """
+    step = sim.step_count
+    try:
+        command.apply(sim)
+    except (IndexError, ValueError, OSError) as e:
+        print("Ignoring command", command, e)
+        return False
+
+    if log is not None:
+        log.record(step, command)
+    sim.publish()
+    return True
+
+
+def drain_commands(sim, source=control_queue, log=None):
+    """
+    Applies every command waiting in `source`, in the order they were sent.
+    Call it between two physics steps.
+
+    Returns:
+        int: The number of commands applied.
+    """
+    applied = 0
+    while True:
+        try:
+            command = source.get(block=False)
+        except queue.Empty:
+            return applied
+
+        if not isinstance(command, Command):
+            print("Ignoring unknown command", command)
+            continue
+
+        applied += execute(sim, command, log)
@@ -1,5 +1,12 @@
 from globals import *
 from body import *
+from particles import *
+from gravity import *
+from spatial_grid import *
+from integrators import *
+import jit_kernels
+from boundaries import pair_distances, periodic_box, escaped
+from initial_conditions import random_bodies, make_particles
 
 import numpy as np
 from math import pow
@@ -128,14 +135,14 @@ def calculate_collision_velocities(
 
     #print("Elastic collision")
 
-    oldk = (ke(mass1, velocity1x, velocity1y), ke(mass2, velocity2x, velocity2y))
-    newk = (ke(mass1, v1fx, v1fy), ke(mass2, v2fx, v2fy))
-    
-    print("Masses", mass1, mass2, "Ratio", mass1/mass2)
-    print("Original velocity:", velocity1x, velocity1y, "/", velocity2x, velocity2y)
-    print("New values", v1fx, v1fy, "/", v2fx, v2fy)
-    print("KE before",oldk[0] , "/", oldk[1], "sum = ", sum(oldk))
-    print("KE after", newk[0]  ,"/", newk[1], "sum = ", sum(newk) )
+    if COLLISION_DEBUG:
+        oldk = (ke(mass1, velocity1x, velocity1y), ke(mass2, velocity2x, velocity2y))
+        newk = (ke(mass1, v1fx, v1fy), ke(mass2, v2fx, v2fy))
+        print("Masses", mass1, mass2, "Ratio", mass1/mass2)
+        print("Original velocity:", velocity1x, velocity1y, "/", velocity2x, velocity2y)
+        print("New values", v1fx, v1fy, "/", v2fx, v2fy)
+        print("KE before",oldk[0] , "/", oldk[1], "sum = ", sum(oldk))
+        print("KE after", newk[0]  ,"/", newk[1], "sum = ", sum(newk) )
     #input()
     
     return v1fx, v1fy, v2fx, v2fy
@@ -144,98 +151,6 @@ def calculate_collision_velocities(
 
 
 
-def draw_axes(screen, width, height, offset, color=(0, 0, 0), tick_size=20, label_distance=15):
-    """
-    Draws X and Y axes with tickmarks, numbers, and arrows on the Pygame screen.
-
-    Args:
-        screen: The Pygame screen surface.
-        width: The width of the screen.
-        height: The height of the screen.
-        color: The color of the axes (default black).
-        tick_size: The size of the tick marks (default 10 pixels).
-        label_distance: The distance between the axis and the labels (default 5 pixels).
-    """
-    # Draw X-axis
-    #print("Height",  height // 2)
-    pygame.draw.line(screen, color,
-                     (0, int((height // 2)+offset[1])),
-                     (width,int((height // 2)+offset[1])),
-                    2)
-
-    # Draw Y-axis
-    pygame.draw.line(screen, color,
-                     ( int((width // 2)+offset[0]), 0),
-                     (int((width // 2)+offset[0]), height),
-                    2)
-
-    tickmarks = False
-    # Draw tick marks and labels on X-axis
-    for i in range(1, width // tick_size + 1):
-        if(not tickmarks):
-            break 
-        
-        x = i * tick_size
-        pygame.draw.line(
-            screen,
-            color,
-            (x, height // 2 - tick_size // 2),
-            (x, height // 2 + tick_size // 2),
-            1,
-        )
-        
-        # Draw label (avoid drawing at the end)
-        if i != width // tick_size:
-            label_surface = pygame.font.Font(None, 15).render(
-                str(i * tick_size), True, color
-            )
-            screen.blit(
-                label_surface,
-                (x - label_surface.get_width() // 2, height // 2 + label_distance),
-            )
-
-    # Draw tick marks and labels on Y-axis
-    for i in range(1, height // tick_size + 1):
-        if(not tickmarks):
-            break
-
-        y = i * tick_size
-        pygame.draw.line(
-            screen,
-            color,
-            (width // 2 - tick_size // 2, y),
-            (width // 2 + tick_size // 2, y),
-            1,
-        )
-        # Draw label (avoid drawing at the end)
-        if i != height // tick_size:
-            label_surface = pygame.font.Font(None, 15).render(
-                str(i * tick_size), True, color
-            )
-            screen.blit(
-                label_surface,
-                (
-                    width // 2 - label_surface.get_width() - label_distance,
-                    y - label_surface.get_height() // 2,
-                ),
-            )
-
-    # Draw arrows at the end of axes
-    arrow_size = 10
-    pygame.draw.polygon(
-        screen,
-        color,
-        [
-            (width - arrow_size, height // 2 - arrow_size // 2),
-            (width, height // 2),
-            (width - arrow_size, height // 2 + arrow_size // 2),
-        ],
-        2,
-    )
-
-
-
-
 def gravitational_acceleration(
     body1_mass, body2_mass, body1_pos, body2_pos, gravitational_constant
 ):
@@ -257,7 +172,7 @@ def gravitational_acceleration(
 
     # Check for zero distance (avoid division by zero)
     if np.linalg.norm(distance_vector) < 1e-10:
-        return np.zeros(2), np.zeros(2)
+        return np.zeros(2)
 
     # Calculate magnitude of gravitational force
     force_magnitude = (
@@ -322,73 +237,76 @@ def do_not_overlap(p1, p2, r1, r2):
 
 
 def create_bodies(num):
-    min_radius = 15
-    max_radius = 30
-    minmass = MIN_MASS
-    maxmass = MAX_MASS
-    ret = []
-
-    for i in range(num):
-        found = False
-        c = random.randrange(64, 256)
-        
-        color = (
-            random.randrange(64, 256),
-            random.randrange(64, 256),
-            random.randrange(64, 256),
-        )
-        
-        if(COLOR_PALETTE == "scientific"):
-            color = (c, c, c)
-        
+    """
+    Creates num bodies at rest, with radii between 15 and 30, placed on the
+    screen without overlaps (see initial_conditions.random_bodies).
 
-        while not found:
-            rad = random.randrange(min_radius, max_radius + 1)
-            test_x = random.randrange(rad, screen_width + 1)
-            test_y = random.randrange(rad, screen_height + 1)
+    The generator is seeded from the random module, so random.seed still
+    makes the bodies reproducible.
+    """
+    return make_particles(random_bodies(num, seed=random.getrandbits(64)))
 
-            found = True
-            
-            for other in ret:
-                good = do_not_overlap((other.x, other.y), (test_x, test_y), other.rad, rad)
 
-                if not good:
-                    found = False
-                    break
-            
-        ret.append(Body(rad, test_x, test_y, color))
-        ret[-1].mass = minmass + ((maxmass - minmass) * rad / max_radius)
+def calc_forces(b):
+    # Gravity and motion for one TIMESTEP with the configured integrator
+    integrate(b, TIMESTEP)
 
-    return ret
 
+def step(b, ind_fixed, timer=None):
+    """
+    Runs one physics step: gravity, motion and collisions, then removes
+    the bodies that escaped through open boundaries.
 
-def calc_forces(b):
+    Args:
+        b: The Particles store.
+        ind_fixed: The touching pairs returned by the previous step.
+        timer: Optional profiling.FrameTimer the phases are charged to.
 
-        
-    for i in range(len(b)):
-        if (not GRAVITY_ENABLED):
-            break
-        
-        for k in range(len(b)):
-            if k == i:
-                continue
-
-            d = point_dist(b[i].x, b[i].y, b[k].x, b[k].y)
-
-            acc = gravitational_acceleration(
-                b[i].mass,
-                b[k].mass,
-                np.array([b[i].x, b[i].y]),
-                np.array([b[k].x, b[k].y]),
-                G,
-            )
+    Returns:
+        The touching pairs to pass to the next step.
+    """
+    compiled = PHYSICS_BACKEND == "numba" and jit_kernels.AVAILABLE
+
+    b.prev_pos[:] = b.pos
+    if compiled:
+        jit_kernels.advance(b)
+    else:
+        calc_forces(b)
+    if timer is not None:
+        timer.lap("forces")
+
+    if CCD_ENABLED:
+        sweep_collisions(b, ind_fixed)
+
+    if compiled:
+        touching = jit_kernels.collide(b, ind_fixed)
+    else:
+        touching = univ_collision(b, ind_fixed)
+
+    if BOUNDARY_MODE == "open":
+        touching = remove_escaped(b, touching)
+    if timer is not None:
+        timer.lap("collisions")
+    return touching
 
 
-            
-            b[i].accel(acc[0] * TIMESTEP, acc[1] * TIMESTEP)
+def remove_escaped(b, touching, cutoff=OPEN_CUTOFF):
+    """
+    Removes the bodies that went more than `cutoff` pixels past the screen
+    edges, all at once.
+
+    Returns:
+        The touching pairs, renumbered for the remaining bodies.
+    """
+    gone = escaped(b.pos, cutoff)
+    if not gone.any():
+        return touching
 
-    for elem in b:
-        elem.update_pos()
+    new_index = b.compact(~gone)
+    return {
+        (int(new_index[i]), int(new_index[k])) for i, k in touching
+        if new_index[i] >= 0 and new_index[k] >= 0
+    }
 
 
 def separate_circles(c1x, c1y, r1, c2x, c2y, r2):
@@ -426,8 +344,13 @@ def separate_circles(c1x, c1y, r1, c2x, c2y, r2):
 
   # Normalize the direction vector
   norm = math.sqrt(direction_x**2 + direction_y**2)
-  unit_direction_x = direction_x / norm
-  unit_direction_y = direction_y / norm
+  if norm == 0:
+    # Coincident centers (runaway bodies all wrapped onto the same point of
+    # a periodic box), push them apart along x
+    unit_direction_x, unit_direction_y = 1.0, 0.0
+  else:
+    unit_direction_x = direction_x / norm
+    unit_direction_y = direction_y / norm
 
   # Move each circle center by half of the difference between actual distance 
   # and minimum distance in the direction vector
@@ -439,84 +362,188 @@ def separate_circles(c1x, c1y, r1, c2x, c2y, r2):
   return new_c1x, new_c1y, new_c2x, new_c2y
 
 
+def sweep_collisions(b, ind_fixed):
+    """
+    Continuous collision detection for the step that just moved the bodies
+    from prev_pos to pos.
+
+    Every pair that came into contact during the step, including the pairs
+    that went through each other, is moved back to the moment of contact,
+    bounced there and moved on with the new velocities for the rest of the
+    step. The pairs are handled in the order they touched, and a body takes
+    part in at most one of them per step. The bodies that bounced off a
+    border during the step did not move along a straight line, they are
+    left out. The bounced bodies go through the boundary conditions again,
+    since their new path may cross a border. Whatever still overlaps
+    afterwards is left to univ_collision.
+
+    Args:
+        b: The Particles store.
+        ind_fixed: Set of the pairs that already bounced, the pairs bounced
+            here are added so univ_collision does not bounce them again.
+
+    Returns:
+        int: The number of pairs bounced.
+    """
+    cand_i, cand_k, cand_t = swept_pairs(b.prev_pos, b.pos, b.rad, box=periodic_box())
+    if len(cand_t) == 0:
+        return 0
+
+    start = b.prev_pos
+    move = b.pos - b.prev_pos
+    done = np.zeros(len(b), dtype=bool)
+    bounced = 0
+
+    for j in np.argsort(cand_t, kind="stable").tolist():
+        i = int(cand_i[j])
+        k = int(cand_k[j])
+        if done[i] or done[k] or b.wall_hit[i] or b.wall_hit[k]:
+            continue
+        done[i] = done[k] = True
+
+        t = float(cand_t[j])
+        vix, viy, vkx, vky = calculate_collision_velocities(
+            b.mass[i], b.mass[k], b.vel[i, 0], b.vel[i, 1], b.vel[k, 0], b.vel[k, 1]
+        )
+        rest = (1 - t) * TIMESTEP
+        b.pos[i] = start[i] + t * move[i] + (vix * rest, viy * rest)
+        b.pos[k] = start[k] + t * move[k] + (vkx * rest, vky * rest)
+        b.vel[i] = (vix, viy)
+        b.vel[k] = (vkx, vky)
+
+        ind_fixed.add((i, k))
+        bounced += 1
+
+    if bounced:
+        b.apply_borders(done)
+    return bounced
+
+
 def univ_collision(b, ind_fixed):
-    found = 0
+    """
+    Separates the overlapping bodies and makes them bounce.
 
-    still_broken = []
+    The spatial grid gives the candidate pairs, and the overlapping ones are
+    resolved one at a time in the same order as a full double loop over the
+    bodies. Separating two bodies can push one of them into a third body, so
+    after every separation the neighbours of the two bodies are checked again
+    and any new overlap still ahead in the loop order is queued.
 
-    for i in range(len(b)):
-        
-        reset_coll = True
-        
-        for k in range(len(b)):
-            if k == i:
-                continue
-
-            if not do_not_overlap(
-                (b[i].x, b[i].y), (b[k].x, b[k].y), b[i].rad, b[k].rad
-            ):
-                #print("Collided")
-                reset_coll = False
-                b[i].colliding +=1
-                
-                #print("Centering objects")
-                #print("Before", b[i].x, b[i].y, b[k].x, b[k].y)
-                b[i].x, b[i].y, b[k].x, b[k].y = separate_circles(b[i].x, b[i].y, b[i].rad, b[k].x, b[k].y, b[k].rad)
-                #print("After", b[i].x, b[i].y, b[k].x, b[k].y)
-                #input()
-                
-                if sorted([i, k]) in ind_fixed:
-                    #print("Already fixed")
-                    #print("Old distance", b[i].coll_distance[k])
-                    nd = point_dist(b[i].x, b[i].y, b[k].x, b[k].y)
-                    #print("New distance", nd)
-
-                    if nd < b[i].coll_distance[k]:
-                        #print("The object got closer, reverting")
-                        # b[i].step_back()
-                        # b[k].step_back()
-                        pass
-                    else:
-                        #print("The objects are moving away")
-                        pass
-
-                    # input()
-                    still_broken.append(sorted([i, k]))
-                else:
-                    found += 1
-                    r = calculate_collision_velocities(
-                        b[i].mass, b[k].mass, b[i].vx, b[i].vy, b[k].vx, b[k].vy
-                    )
-                    b[i].vx = r[0]
-                    b[i].vy = r[1]
-                    b[k].vx = r[2]
-                    b[k].vy = r[3]
-                    ind_fixed.append(sorted([i, k]))
-                    #print("New velocities", r)
-                    tmp_dist = point_dist(b[i].x, b[i].y, b[k].x, b[k].y)
-                    b[i].coll_distance[k] = tmp_dist
-                    b[k].coll_distance[i] = tmp_dist   
-
-        if(reset_coll):
-            b[i].colliding = 0
-
-    to_delete = []
-    try:
-        for i in range(len(ind_fixed)):
-            if not (ind_fixed[i] in still_broken):
-                to_delete.append(i)
-    except:
-        #print(ind_fixed)
-        exit(1)
-
-    tmplist = [a for b, a in enumerate(ind_fixed) if b not in to_delete]
-
-    if found > 0:
-        #print("Found collisions:", found)
-        # input()
-        pass
-
-    return tmplist
+    With periodic boundaries every pair is compared through its nearest
+    image.
+
+    Args:
+        b: The Particles store.
+        ind_fixed: Set of the (i, k) pairs, i < k, that already bounced and
+            are still touching (returned by the previous call).
+
+    Returns:
+        The set of bounced pairs that are still touching, to pass to the next call.
+    """
+    still_broken = set()
+
+    pos = b.pos
+    vel = b.vel
+    mass = b.mass
+    rad = b.rad
+
+    box = periodic_box()
+    cand_i, cand_k = candidate_pairs(pos, rad, box=box)
+
+    # Neighbour lists of every body, in CSR form
+    src = np.concatenate((cand_i, cand_k))
+    dst = np.concatenate((cand_k, cand_i))
+    by_src = np.argsort(src, kind="stable")
+    neighbours = dst[by_src]
+    indptr = np.searchsorted(src[by_src], np.arange(len(b) + 1))
+
+    d = pair_distances(pos, cand_i, cand_k, box)
+    hit = d <= rad[cand_i] + rad[cand_k]
+
+    # Both orderings of every overlapping pair, visited like the old i/k loops
+    pending = list(zip(cand_i[hit].tolist(), cand_k[hit].tolist()))
+    pending += [(k, i) for i, k in pending]
+    if not pending:
+        b.colliding[:] = 0
+        return ind_fixed & still_broken
+
+    heapq.heapify(pending)
+    queued = set(pending)
+
+    # The pairs are resolved one by one, plain Python floats are much faster
+    # than NumPy scalars for that
+    x = pos[:, 0].tolist()
+    y = pos[:, 1].tolist()
+    vx = vel[:, 0].tolist()
+    vy = vel[:, 1].tolist()
+    r = rad.tolist()
+    m = mass.tolist()
+    neighbours = neighbours.tolist()
+    indptr = indptr.tolist()
+
+    def image(i, k):
+        # Offset from k to its image nearest to i
+        return 0.0, 0.0
+
+    if box is not None:
+        width, height = box
+
+        def image(i, k):
+            dx = x[k] - x[i]
+            dy = y[k] - y[i]
+            return math.remainder(dx, width) - dx, math.remainder(dy, height) - dy
+
+    touching = np.zeros(len(b), dtype=bool)
+    changed = set()
+
+    while pending:
+        current = heapq.heappop(pending)
+        queued.discard(current)
+        i, k = current
+
+        # Earlier separations may already have pushed these two apart
+        sx, sy = image(i, k)
+        if do_not_overlap((x[i], y[i]), (x[k] + sx, y[k] + sy), r[i], r[k]):
+            continue
+
+        touching[i] = True
+        b.colliding[i] += 1
+        changed.add(i)
+        changed.add(k)
+
+        x[i], y[i], x[k], y[k] = separate_circles(x[i], y[i], r[i], x[k] + sx, y[k] + sy, r[k])
+        x[k] -= sx
+        y[k] -= sy
+
+        key = (i, k) if i < k else (k, i)
+        if key in ind_fixed:
+            #print("Already fixed")
+            still_broken.add(key)
+        else:
+            vx[i], vy[i], vx[k], vy[k] = calculate_collision_velocities(
+                m[i], m[k], vx[i], vy[i], vx[k], vy[k]
+            )
+            ind_fixed.add(key)
+
+        for moved in (i, k):
+            for other in neighbours[indptr[moved]:indptr[moved + 1]]:
+                sx, sy = image(moved, other)
+                if do_not_overlap((x[moved], y[moved]), (x[other] + sx, y[other] + sy), r[moved], r[other]):
+                    continue
+                for pair in ((moved, other), (other, moved)):
+                    if pair > current and pair not in queued:
+                        heapq.heappush(pending, pair)
+                        queued.add(pair)
+
+    changed = np.fromiter(changed, dtype=np.int64)
+    pos[changed, 0] = np.take(x, changed)
+    pos[changed, 1] = np.take(y, changed)
+    vel[changed, 0] = np.take(vx, changed)
+    vel[changed, 1] = np.take(vy, changed)
+
+    b.colliding[~touching] = 0
+
+    return ind_fixed & still_broken
 
 
 def is_click_in_circle(mouse_x, mouse_y, center_x, center_y, radius):
@@ -1,12 +1,11 @@
-import pygame
 import random
 import time
 import numpy as np
 import math
 import queue
-import tkinter as tk
 import threading
 import signal
+import heapq
 
 
 # Define the gravitational constant
@@ -20,12 +19,110 @@ screen_width = 800
 screen_height = 600
 
 TIMESTEP = 0.0064
+# Physics steps per second of wall clock time, independent of the frame rate
+# (60 gives the old one step per rendered frame)
+STEPS_PER_SECOND = 60
+# Most physics steps run in one frame, the backlog above it is dropped
+MAX_SUBSTEPS = 8
+# Wall clock seconds per frame the physics may use before it yields to rendering
+PHYSICS_TIME_BUDGET = 0.012
+FPS = 60
 BODIES_GEN = 3
 
 TRAIL_LENGHT = 1600
 
+# Velocity labels are drawn only on bodies at least this many pixels in
+# radius on screen (0 labels every body), LABELS_ENABLED turns them off
+LABELS_ENABLED = True
+LABEL_MIN_RADIUS = 0
+# Trails and labels are skipped when zoomed out below these factors
+TRAIL_MIN_ZOOM = 0.0
+LABEL_MIN_ZOOM = 0.0
+# Bodies smaller than this many pixels in radius on screen are drawn as a
+# single pixel instead of a circle
+POINT_RADIUS = 1.0
+
+# "bodies" draws every body, "density" draws a heatmap of the bodies
+# (toggled with the H key)
+DRAW_MODE = "bodies"
+# Heatmap weighting, "mass" or "count"
+DENSITY_WEIGHT = "mass"
+# Fraction of the previous frames kept in the heatmap, for a motion blur
+DENSITY_DECAY = 0.0
+
+# Refreshes per second of the Tk table and number of body rows it shows
+TABLE_REFRESH_HZ = 8
+TABLE_VISIBLE_ROWS = 10
+
+# Run the physics in a separate process (physics_worker.py), so it does not
+# share a core with the rendering and the Tk panel
+PHYSICS_WORKER = True
+
+# File the commands applied in the GUI are logged to on exit, for replay with
+# headless.py --replay (None disables the log)
+COMMAND_LOG_PATH = None
+# Checkpoint file written with F5 and loaded with F9, see checkpoint.py
+CHECKPOINT_PATH = "checkpoint.nbc"
+# Rendered text surfaces kept by the text cache
+TEXT_CACHE_SIZE = 512
+
+# Frame timing HUD (F2), see profiling.py: shown at start, frames kept for
+# the HUD and the CSV export (F3), HUD refreshes per second, frames profiled
+# by a cProfile capture (F4) and folder the exports are written to
+PROFILE_HUD = False
+PROFILE_HISTORY = 300
+PROFILE_HUD_HZ = 4
+PROFILE_CAPTURE_FRAMES = 120
+PROFILE_DIR = "."
+
 GRAVITY_ENABLED = False
-UNIV_BORDERS = True
+# What happens at the screen edges: "reflect" bounces the bodies back
+# inside, "periodic" wraps them around (the space is a torus and gravity
+# and collisions act through the nearest image), "open" lets them fly away
+# and removes the ones farther than OPEN_CUTOFF pixels past the edges
+# (None keeps them forever)
+BOUNDARY_MODE = "reflect"
+OPEN_CUTOFF = 2000.0
+# Print the velocities and energies of every collision
+COLLISION_DEBUG = False
+# Continuous collision detection: find the contacts along the whole move of
+# every step instead of only the overlaps at its end, so fast bodies cannot
+# pass through each other at large TIMESTEPs (see func.sweep_collisions)
+CCD_ENABLED = False
+
+# Upper bound on the pairs handled at once by the vectorized gravity kernel,
+# keeps the N x N temporaries small on big systems
+GRAVITY_CHUNK_PAIRS = 2**22
+# Plummer softening length added to the gravity distances (0 = plain Newton)
+GRAVITY_SOFTENING = 0.0
+
+# "direct" for the exact pairwise sum, "barnes_hut" for the quadtree solver,
+# "parallel" for the direct sum split over several cores
+FORCE_BACKEND = "direct"
+BH_THETA = 0.5
+BH_LEAF_SIZE = 8
+# Pool used by the "parallel" backend: workers (None = every core), target
+# bodies per task, and "process" or "thread" workers
+FORCE_WORKERS = None
+FORCE_TILE_SIZE = 512
+FORCE_POOL = "process"
+
+# "numpy" for the array code, "numba" for the compiled kernels of
+# jit_kernels.py (falls back to "numpy" when Numba is not installed)
+PHYSICS_BACKEND = "numpy"
+# Let Numba reorder floating point operations (faster, not bit for bit)
+JIT_FASTMATH = False
+
+# Time integration scheme: "euler" (semi-implicit, the original one),
+# "leapfrog", "verlet", "yoshida4" or "block", see integrators.py
+INTEGRATOR = "euler"
+
+# Block timesteps ("block" integrator): every body steps with TIMESTEP / 2**level,
+# the level is picked from eta * |a| / |jerk| ("jerk") or from
+# eta * sqrt(radius / |a|) ("accel", no extra O(N^2) pass)
+BLOCK_MAX_LEVEL = 6
+BLOCK_ETA = 0.02
+BLOCK_CRITERION = "jerk"
 
 ZOOM_ENABLED = False
 COLOR_PALETTE = "scientific"
@@ -38,8 +135,7 @@ control_queue = queue.Queue()
 tk_terminate = threading.Event()
 shared_tk_window = queue.Queue()
 
-pygame.init()
-screen = pygame.display.set_mode((screen_width, screen_height))
-font = pygame.font.Font(None, 32)
+# The pygame display and fonts are created on first use by render.get_screen
+# and text_cache.get_font, so the physics can be imported without a display
 pygame_terminate = False
 
@@ -0,0 +1,196 @@
+from globals import *
+from boundaries import minimum_image, periodic_box
+from quadtree import barnes_hut_accelerations
+
+
+def direct_accelerations(pos, mass, targets=None, softening=GRAVITY_SOFTENING, chunk_pairs=GRAVITY_CHUNK_PAIRS, gravitational_constant=G,
+                         box=None):
+    """
+    Computes the gravitational acceleration on a set of bodies by summing the
+    attraction of every other body (direct O(N^2) sum), with broadcasted
+    array operations instead of one call per pair.
+
+    Args:
+        pos (np.ndarray): (N, 2) positions of all the bodies.
+        mass (np.ndarray): (N,) masses of all the bodies.
+        targets (np.ndarray): Indices of the bodies to compute the acceleration
+            for (default: all of them).
+        softening (float): Plummer softening length added to every distance.
+        chunk_pairs (int): Maximum number of pairs evaluated at once, the
+            targets are processed in blocks of rows to bound the temporaries.
+        gravitational_constant (float): Gravitational constant (G).
+        box (tuple): (width, height) of the periodic box, every body is then
+            attracted by the nearest image of the others.
+
+    Returns:
+        np.ndarray: (len(targets), 2) accelerations.
+    """
+    x = pos[:, 0]
+    y = pos[:, 1]
+
+    if targets is None:
+        tx = x
+        ty = y
+    else:
+        tx = x[targets]
+        ty = y[targets]
+
+    acc = np.zeros((len(tx), 2))
+    if len(tx) == 0 or len(x) == 0:
+        return acc
+
+    rows = max(1, chunk_pairs // len(x))
+    eps2 = softening ** 2
+
+    for start in range(0, len(tx), rows):
+        end = start + rows
+        dx = x[None, :] - tx[start:end, None]
+        dy = y[None, :] - ty[start:end, None]
+        if box is not None:
+            minimum_image(dx, box[0])
+            minimum_image(dy, box[1])
+
+        d2 = dx * dx + dy * dy
+        r2 = d2 + eps2
+
+        # Same as gravitational_acceleration: coincident bodies (and the body
+        # itself) do not contribute
+        close = d2 < 1e-20
+        r2[close] = 1.0
+        w = mass / (r2 * np.sqrt(r2))
+        w[close] = 0.0
+
+        acc[start:end, 0] = np.einsum("ij,ij->i", w, dx)
+        acc[start:end, 1] = np.einsum("ij,ij->i", w, dy)
+
+    acc *= gravitational_constant
+    return acc
+
+
+def gravity_accelerations(pos, mass, targets=None, backend=FORCE_BACKEND, box=None):
+    """
+    Computes the gravitational accelerations with the selected force backend.
+
+    Args:
+        pos (np.ndarray): (N, 2) positions of all the bodies.
+        mass (np.ndarray): (N,) masses of all the bodies.
+        targets (np.ndarray): Indices of the bodies to compute the acceleration
+            for (default: all of them).
+        backend (str): "direct", "barnes_hut" or "parallel" (direct sum
+            in tiles on several cores, see parallel_gravity).
+        box (tuple): (width, height) of the periodic box, by default the
+            one of BOUNDARY_MODE (None unless it is "periodic").
+
+    Returns:
+        np.ndarray: (len(targets), 2) accelerations.
+    """
+    if box is None:
+        box = periodic_box()
+
+    if backend == "direct":
+        return direct_accelerations(pos, mass, targets, box=box)
+    elif backend == "barnes_hut":
+        return barnes_hut_accelerations(pos, mass, targets, box=box)
+    elif backend == "parallel":
+        # Imported here, parallel_gravity itself builds on this module
+        from parallel_gravity import parallel_accelerations
+        return parallel_accelerations(pos, mass, targets, box=box)
+    else:
+        raise ValueError("Unknown force backend: " + str(backend))
+
+
+def potential_energy(pos, mass, softening=GRAVITY_SOFTENING, chunk_pairs=GRAVITY_CHUNK_PAIRS, gravitational_constant=G, box=None):
+    """
+    Computes the total gravitational potential energy of the system,
+    -G * m_i * m_k / r_ik summed over every unordered pair.
+
+    Args:
+        pos (np.ndarray): (N, 2) positions of the bodies.
+        mass (np.ndarray): (N,) masses of the bodies.
+        softening (float): Plummer softening length, must match the one used
+            for the forces for the energy to be conserved.
+        box (tuple): (width, height) of the periodic box, for the nearest
+            image distances.
+
+    Returns:
+        float: The potential energy.
+    """
+    n = len(pos)
+    if n < 2:
+        return 0.0
+
+    rows = max(1, chunk_pairs // n)
+    eps2 = softening ** 2
+    energy = 0.0
+
+    for start in range(0, n, rows):
+        end = min(start + rows, n)
+        d = pos[None, :, :] - pos[start:end, None, :]
+        if box is not None:
+            minimum_image(d[..., 0], box[0])
+            minimum_image(d[..., 1], box[1])
+        d2 = (d * d).sum(axis=2)
+
+        # Only count the pairs (i, k) with k > i, and skip coincident bodies
+        upper = np.arange(n)[None, :] > np.arange(start, end)[:, None]
+        keep = upper & (d2 >= 1e-20)
+
+        r = np.sqrt(d2[keep] + eps2)
+        mm = mass[start:end, None] * mass[None, :]
+        energy -= (mm[keep] / r).sum()
+
+    return gravitational_constant * energy
+
+
+def direct_jerk(pos, vel, mass, targets=None, softening=GRAVITY_SOFTENING, chunk_pairs=GRAVITY_CHUNK_PAIRS, gravitational_constant=G,
+                box=None):
+    """
+    Computes the jerk (time derivative of the gravitational acceleration) of
+    the target bodies by direct summation, used to pick their timesteps.
+
+    Args:
+        pos (np.ndarray): (N, 2) positions of all the bodies.
+        vel (np.ndarray): (N, 2) velocities of all the bodies.
+        mass (np.ndarray): (N,) masses of all the bodies.
+        targets (np.ndarray): Indices of the bodies to compute the jerk for
+            (default: all of them).
+        box (tuple): (width, height) of the periodic box, for the nearest
+            image separations.
+
+    Returns:
+        np.ndarray: (len(targets), 2) jerks.
+    """
+    if targets is None:
+        targets = np.arange(len(pos))
+
+    jerk = np.zeros((len(targets), 2))
+    if len(targets) == 0 or len(pos) == 0:
+        return jerk
+
+    rows = max(1, chunk_pairs // len(pos))
+    eps2 = softening ** 2
+
+    for start in range(0, len(targets), rows):
+        t = targets[start:start + rows]
+        dx = pos[None, :, 0] - pos[t, None, 0]
+        dy = pos[None, :, 1] - pos[t, None, 1]
+        if box is not None:
+            minimum_image(dx, box[0])
+            minimum_image(dy, box[1])
+        dvx = vel[None, :, 0] - vel[t, None, 0]
+        dvy = vel[None, :, 1] - vel[t, None, 1]
+
+        d2 = dx * dx + dy * dy
+        r2 = d2 + eps2
+        close = d2 < 1e-20
+        r2[close] = 1.0
+
+        inv_r3 = mass / (r2 * np.sqrt(r2))
+        inv_r3[close] = 0.0
+        rv = 3 * (dx * dvx + dy * dvy) / r2
+
+        jerk[start:start + rows, 0] = (inv_r3 * (dvx - rv * dx)).sum(axis=1)
+        jerk[start:start + rows, 1] = (inv_r3 * (dvy - rv * dy)).sum(axis=1)
+
+    jerk *= gravitational_constant
+    return jerk
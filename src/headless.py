@@ -0,0 +1,136 @@
+"""
+Runs the simulation without pygame or Tk and writes the results to a file.
+
+    python headless.py --bodies 200 --steps 5000 --seed 1 --out result.npz
+
+The initial state comes either from a generator of initial_conditions.py
+(--ic, "random" is create_bodies, all seeded with --seed) or from an .npz
+file holding pos, vel, mass and rad arrays (and optionally color), the same
+layout written by --out. A command log saved by the GUI (COMMAND_LOG_PATH)
+can be replayed on top of it with --replay.
+
+--load continues from a checkpoint (see checkpoint.py, F5 in the GUI
+writes one), restoring the step count and the random state as well, and
+--checkpoint writes one at the end of the run (and every
+--checkpoint-every steps), for runs that can be resumed exactly.
+"""
+import argparse
+
+from globals import *
+from func import *
+from simulation import *
+from commands import *
+from checkpoint import save_checkpoint, load_checkpoint
+from initial_conditions import GENERATORS, make_particles
+
+
+def load_bodies(path):
+    """
+    Builds a Particles store from an .npz initial-condition file.
+    """
+    data = np.load(path)
+    pos = data["pos"]
+    n = len(pos)
+
+    vel = data["vel"] if "vel" in data else np.zeros((n, 2))
+    color = data["color"] if "color" in data else np.full((n, 3), 255)
+
+    bodies = Particles(n)
+    for i in range(n):
+        bodies.add(pos[i, 0], pos[i, 1], data["rad"][i], data["mass"][i], vel[i, 0], vel[i, 1], color[i])
+
+    # add clamps the bodies inside the screen, keep the file positions as they are
+    bodies.pos[:] = pos
+    bodies.prev_pos[:] = pos
+    return bodies
+
+
+def save_results(path, sim, trajectory=None):
+    b = sim.bodies
+    arrays = dict(
+        pos=b.pos, vel=b.vel, mass=b.mass, rad=b.rad, color=b.color,
+        steps=sim.step_count, sim_time=sim.sim_time,
+    )
+    if trajectory:
+        if len({len(pos) for pos in trajectory}) == 1:
+            arrays["trajectory"] = np.stack(trajectory)
+        else:
+            # Open boundaries removed bodies on the way: the recorded
+            # positions one after the other, and the bodies in each record
+            arrays["trajectory"] = np.concatenate(trajectory)
+            arrays["trajectory_counts"] = np.array([len(pos) for pos in trajectory])
+    np.savez(path, **arrays)
+
+
+def run(args):
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.load:
+        checkpoint = load_checkpoint(args.load)
+        bodies = Particles(checkpoint.bodies)
+    elif args.init:
+        bodies = load_bodies(args.init)
+    elif args.ic == "random":
+        bodies = create_bodies(args.bodies)
+    else:
+        bodies = make_particles(GENERATORS[args.ic](args.bodies, seed=args.seed))
+
+    sim = Simulation(bodies)
+    if args.load:
+        checkpoint.restore(sim)
+    trajectory = []
+    player = CommandLog.load(args.replay).player() if args.replay else None
+
+    start = time.perf_counter()
+    for i in range(args.steps):
+        if player is not None:
+            player.apply_due(sim)
+        sim.step()
+
+        if args.save_every and (i + 1) % args.save_every == 0:
+            trajectory.append(bodies.pos.copy())
+
+        if args.checkpoint and args.checkpoint_every and (i + 1) % args.checkpoint_every == 0:
+            save_checkpoint(args.checkpoint, sim)
+
+        if args.report_every and (i + 1) % args.report_every == 0:
+            elapsed = time.perf_counter() - start
+            print(f"step {i + 1}/{args.steps}  {(i + 1) / elapsed:.1f} steps/s")
+            if bodies.block_stats is not None:
+                print("    block timesteps:", block_stats_text(bodies))
+
+    elapsed = time.perf_counter() - start
+    rate = args.steps / elapsed if elapsed > 0 else float("inf")
+    print(f"{len(bodies)} bodies, {args.steps} steps in {elapsed:.3f} s ({rate:.1f} steps/s)")
+
+    if args.out:
+        save_results(args.out, sim, trajectory)
+        print("Results written to", args.out)
+
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, sim)
+        print("Checkpoint written to", args.checkpoint)
+
+    return sim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless n-body simulation runner")
+    parser.add_argument("--bodies", type=int, default=BODIES_GEN, help="number of bodies to create")
+    parser.add_argument("--steps", type=int, default=1000, help="number of physics steps to run")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the initial conditions")
+    parser.add_argument("--ic", default="random", choices=sorted(GENERATORS), help="initial condition generator")
+    parser.add_argument("--init", default=None, help=".npz file with the initial state")
+    parser.add_argument("--out", default=None, help=".npz file the final state is written to")
+    parser.add_argument("--load", default=None, help="checkpoint to continue from")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file written at the end")
+    parser.add_argument("--checkpoint-every", type=int, default=0, help="also write the checkpoint every N steps")
+    parser.add_argument("--replay", default=None, help="command log to apply while running")
+    parser.add_argument("--save-every", type=int, default=0, help="also record the positions every N steps")
+    parser.add_argument("--report-every", type=int, default=0, help="print progress every N steps")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Seeded, vectorized generators of initial conditions.
+
+Every generator takes a `seed` (anything np.random.default_rng accepts)
+and returns a dict of pos, vel, mass, rad and color arrays, the layout
+Particles.load and the .npz files of headless.py use. Turn one into a
+store with make_particles. Nothing loops over the bodies in Python, so
+100k bodies take a fraction of a second.
+
+poisson_disk places discs that do not overlap. It throws candidates in
+batches and tests them on a background grid with cells small enough to
+hold at most one disc centre, so each candidate is checked against a few
+neighbouring cells instead of against every placed body. The others are
+astrophysical setups for the gravity backends: a uniform disc, a Plummer
+sphere seen from above, a rotating Keplerian disc around a central mass,
+and two Plummer clusters on a collision course.
+"""
+from globals import *
+from particles import Particles
+
+
+def body_colors(n, rng, palette=COLOR_PALETTE):
+    """
+    Random colors as in the original create_bodies: shades of grey for the
+    "scientific" palette, random RGB otherwise.
+    """
+    if palette == "scientific":
+        return np.repeat(rng.integers(64, 256, (n, 1)), 3, axis=1).astype(np.uint8)
+    return rng.integers(64, 256, (n, 3)).astype(np.uint8)
+
+
+def make_particles(arrays, trail_length=TRAIL_LENGHT):
+    """
+    Builds a Particles store holding the bodies of a generator result.
+    """
+    n = len(arrays["pos"])
+    bodies = Particles(n, trail_length)
+    bodies.load(dict(arrays, prev_pos=arrays["pos"]))
+    return bodies
+
+
+def _bodies(pos, vel, mass, rad, rng, palette=COLOR_PALETTE):
+    n = len(pos)
+    return {
+        "pos": pos,
+        "vel": vel,
+        "mass": np.broadcast_to(mass, (n,)).astype(np.float64),
+        "rad": np.broadcast_to(rad, (n,)).astype(np.float64),
+        "color": body_colors(n, rng, palette),
+    }
+
+
+def _merge(*systems):
+    return {name: np.concatenate([s[name] for s in systems]) for name in systems[0]}
+
+
+def poisson_disk(n, min_radius, max_radius, width=screen_width, height=screen_height, seed=None,
+                 integer_radii=False, max_attempts=None):
+    """
+    Places n non-overlapping discs with random radii inside the rectangle
+    (0, 0) - (width, height).
+
+    Args:
+        min_radius, max_radius: Range of the disc radii.
+        integer_radii: Draw whole radii, min_radius to max_radius included.
+        max_attempts: Candidates thrown before giving up (default 50 per
+            disc).
+
+    Returns:
+        tuple: (pos, rad), (n, 2) centres and (n,) radii.
+
+    Raises:
+        ValueError: If the discs do not fit within max_attempts.
+    """
+    rng = np.random.default_rng(seed)
+    if max_attempts is None:
+        max_attempts = 50 * n + 1000
+
+    # Two centres in the same cell would be closer than 2 * min_radius
+    cell = min_radius * math.sqrt(2)
+    reach = math.ceil(2 * max_radius / cell)
+    rows = math.ceil(height / cell) + 2 * reach
+    cols = math.ceil(width / cell) + 2 * reach
+    grid = np.full(rows * cols, -1, dtype=np.int32)  # placed disc in every cell, -1 if empty
+    batch_grid = np.full(rows * cols, -1, dtype=np.int32)
+
+    # Neighbour cells in the flat grid, leaving out the corners farther
+    # than two radii from every point of the centre cell
+    dy, dx = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    gap = cell * np.hypot(np.maximum(abs(dx) - 1, 0), np.maximum(abs(dy) - 1, 0))
+    offsets = (dy * cols + dx)[gap <= 2 * max_radius]
+
+    pos = np.zeros((n, 2))
+    rad = np.zeros(n)
+    placed = 0
+    attempts = 0
+
+    while placed < n:
+        if attempts >= max_attempts:
+            raise ValueError(f"placed only {placed} of {n} discs in {max_attempts} attempts")
+        size = min(max(64, 2 * (n - placed)), max_attempts - attempts)
+        attempts += size
+
+        if integer_radii:
+            r = rng.integers(min_radius, max_radius + 1, size).astype(np.float64)
+        else:
+            r = rng.uniform(min_radius, max_radius, size)
+        x = r + rng.random(size) * (width - 2 * r)
+        y = r + rng.random(size) * (height - 2 * r)
+        cells = ((y / cell).astype(np.int64) + reach) * cols + (x / cell).astype(np.int64) + reach
+
+        # Against the discs placed so far
+        row, near = _neighbours(grid, cells, offsets)
+        hit = np.hypot(x[row] - pos[near, 0], y[row] - pos[near, 1]) <= r[row] + rad[near]
+        free = np.ones(size, dtype=np.bool_)
+        free[row[hit]] = False
+        cand = np.flatnonzero(free)
+
+        # Against the other candidates of the batch: first one per cell,
+        # then every candidate loses to the earlier ones it overlaps
+        _, first = np.unique(cells[cand], return_index=True)
+        cand = cand[np.sort(first)]
+        batch_grid[cells[cand]] = np.arange(len(cand))
+        row, near = _neighbours(batch_grid, cells[cand], offsets)
+        a = cand[row]
+        b = cand[near]
+        hit = (near < row) & (np.hypot(x[a] - x[b], y[a] - y[b]) <= r[a] + r[b])
+        keep = np.ones(len(cand), dtype=np.bool_)
+        keep[row[hit]] = False
+        batch_grid[cells[cand]] = -1
+
+        keep = cand[keep][:n - placed]
+        new = slice(placed, placed + len(keep))
+        pos[new, 0] = x[keep]
+        pos[new, 1] = y[keep]
+        rad[new] = r[keep]
+        grid[cells[keep]] = np.arange(new.start, new.stop)
+        placed += len(keep)
+
+    return pos, rad
+
+
+def _neighbours(grid, cells, offsets):
+    """
+    Returns the (row, disc) pairs of the discs found in the neighbour cells
+    of every cell in `cells`.
+    """
+    near = grid[cells[:, None] + offsets]
+    rows, cols = np.nonzero(near >= 0)
+    return rows, near[rows, cols]
+
+
+def uniform_disc(n, center=(screen_width / 2, screen_height / 2), radius=250.0, mass=MAX_MASS, body_radius=2.0,
+                 speed=0.0, seed=None):
+    """
+    Bodies spread uniformly over a disc, at rest or with random velocities.
+
+    Args:
+        mass: Mass of every body.
+        speed: Standard deviation of the velocity components.
+    """
+    rng = np.random.default_rng(seed)
+    r = radius * np.sqrt(rng.random(n))
+    phi = rng.uniform(0, 2 * np.pi, n)
+    pos = np.asarray(center, dtype=np.float64) + np.stack([r * np.cos(phi), r * np.sin(phi)], axis=1)
+    vel = rng.normal(0, speed, (n, 2)) if speed > 0 else np.zeros((n, 2))
+    return _bodies(pos, vel, mass, body_radius, rng)
+
+
+def plummer(n, center=(screen_width / 2, screen_height / 2), scale=60.0, total_mass=100 * MAX_MASS, body_radius=2.0,
+            cutoff=8.0, velocity=(0.0, 0.0), seed=None):
+    """
+    A Plummer sphere in virial equilibrium, projected on the screen plane.
+
+    Radii are drawn by inverting the cumulative mass profile (cut at
+    `cutoff` scale lengths) and speeds with the rejection method of Aarseth,
+    Henon and Wielen (1974), both on whole arrays.
+
+    Args:
+        scale: Plummer scale length.
+        total_mass: Mass of the cluster, shared equally by the bodies.
+        velocity: Bulk velocity added to every body.
+    """
+    rng = np.random.default_rng(seed)
+    m = total_mass / n
+
+    # Mass fraction inside the cutoff radius
+    u_max = cutoff ** 3 / (1 + cutoff ** 2) ** 1.5
+    u = u_max * (1 - rng.random(n))  # never 0
+    r = scale / np.sqrt(u ** (-2 / 3) - 1)
+
+    # Speeds in units of the escape speed: q ~ q^2 (1 - q^2)^3.5
+    q = np.empty(0)
+    while len(q) < n:
+        trial = rng.random(2 * (n - len(q)) + 16)
+        g = trial ** 2 * (1 - trial ** 2) ** 3.5
+        q = np.concatenate([q, trial[rng.random(len(trial)) * 0.1 < g]])
+    v = q[:n] * np.sqrt(2 * G * total_mass / scale) * (1 + (r / scale) ** 2) ** -0.25
+
+    pos = np.asarray(center, dtype=np.float64) + r[:, None] * _isotropic(rng, n)[:, :2]
+    vel = np.asarray(velocity, dtype=np.float64) + v[:, None] * _isotropic(rng, n)[:, :2]
+    return _bodies(pos, vel, m, body_radius, rng)
+
+
+def _isotropic(rng, n):
+    # Random unit vectors in 3D
+    z = rng.uniform(-1, 1, n)
+    phi = rng.uniform(0, 2 * np.pi, n)
+    s = np.sqrt(1 - z ** 2)
+    return np.stack([s * np.cos(phi), s * np.sin(phi), z], axis=1)
+
+
+def keplerian_disc(n, center=(screen_width / 2, screen_height / 2), inner=60.0, outer=280.0, central_mass=1e4 * MAX_MASS,
+                   mass=MIN_MASS, central_radius=15.0, body_radius=1.5, clockwise=False, seed=None):
+    """
+    A heavy central body (index 0) with n light bodies on circular orbits
+    around it, spread uniformly over the ring between `inner` and `outer`.
+
+    The orbital speed only accounts for the central mass, keep the disc
+    light compared to it.
+    """
+    rng = np.random.default_rng(seed)
+    r = np.sqrt(rng.uniform(inner ** 2, outer ** 2, n))
+    phi = rng.uniform(0, 2 * np.pi, n)
+    cx, cy = center
+
+    pos = np.stack([cx + r * np.cos(phi), cy + r * np.sin(phi)], axis=1)
+    speed = np.sqrt(G * central_mass / r)
+    if clockwise:
+        speed = -speed
+    vel = np.stack([-speed * np.sin(phi), speed * np.cos(phi)], axis=1)
+
+    disc = _bodies(pos, vel, mass, body_radius, rng)
+    central = _bodies(np.array([[cx, cy]], dtype=np.float64), np.zeros((1, 2)), central_mass, central_radius, rng)
+    central["color"][:] = 255
+    return _merge(central, disc)
+
+
+def colliding_clusters(n, separation=400.0, speed=None, scale=40.0, total_mass=100 * MAX_MASS, body_radius=2.0,
+                       center=(screen_width / 2, screen_height / 2), seed=None):
+    """
+    Two Plummer clusters of n // 2 and n - n // 2 bodies, `separation` apart
+    along x, moving towards each other.
+
+    Args:
+        speed: Approach speed of each cluster, by default the speed they
+            would reach falling from infinity to the given separation.
+    """
+    rng = np.random.default_rng(seed)
+    if speed is None:
+        speed = math.sqrt(G * total_mass / separation)
+
+    cx, cy = center
+    half = n // 2
+    seeds = rng.integers(0, 2 ** 63, 2)
+    left = plummer(half, (cx - separation / 2, cy), scale, total_mass * half / n, body_radius,
+                   velocity=(speed, 0.0), seed=seeds[0])
+    right = plummer(n - half, (cx + separation / 2, cy), scale, total_mass * (n - half) / n, body_radius,
+                    velocity=(-speed, 0.0), seed=seeds[1])
+    return _merge(left, right)
+
+
+def random_bodies(n, min_radius=15, max_radius=30, min_mass=MIN_MASS, max_mass=MAX_MASS, seed=None):
+    """
+    The bodies of the original create_bodies: whole radii between min_radius
+    and max_radius, placed on the screen without overlaps, at rest, with the
+    mass growing with the radius.
+    """
+    rng = np.random.default_rng(seed)
+    pos, rad = poisson_disk(n, min_radius, max_radius, seed=rng, integer_radii=True)
+    mass = min_mass + (max_mass - min_mass) * rad / max_radius
+    return _bodies(pos, np.zeros((n, 2)), mass, rad, rng)
+
+
+GENERATORS = {
+    "random": random_bodies,
+    "disc": uniform_disc,
+    "plummer": plummer,
+    "kepler": keplerian_disc,
+    "clusters": colliding_clusters,
+}
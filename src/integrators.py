@@ -0,0 +1,275 @@
+from globals import *
+from gravity import *
+from boundaries import periodic_box
+
+# Coefficients of the 4th order Yoshida (Forest-Ruth) scheme
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -(2 ** (1 / 3)) * YOSHIDA_W1
+YOSHIDA_DRIFT = (YOSHIDA_W1 / 2, (YOSHIDA_W0 + YOSHIDA_W1) / 2, (YOSHIDA_W0 + YOSHIDA_W1) / 2, YOSHIDA_W1 / 2)
+YOSHIDA_KICK = (YOSHIDA_W1, YOSHIDA_W0, YOSHIDA_W1)
+
+
+def gravity_accel(b, targets=None):
+    """
+    Accelerations of the target bodies (all by default) with the configured
+    force backend, zero when gravity is disabled.
+    """
+    if not GRAVITY_ENABLED:
+        return np.zeros((len(b) if targets is None else len(targets), 2))
+    return gravity_accelerations(b.pos, b.mass, targets)
+
+
+def cached_accel(b, accel):
+    """
+    Returns the accelerations for the current positions, reusing the ones
+    computed at the end of the previous step when nothing moved since then
+    (collisions, drags and edits all change the positions or masses).
+    """
+    cache = b.acc_cache
+    if cache is not None and np.array_equal(cache[0], b.pos) and np.array_equal(cache[1], b.mass):
+        return cache[2]
+
+    acc = accel(b)
+    b.acc_cache = (b.pos.copy(), b.mass.copy(), acc)
+    return acc
+
+
+def kick(b, acc, dt):
+    # Bodies that are touching something do not get accelerated
+    free = b.colliding == 0
+    if free.all():
+        b.vel += acc * dt
+    else:
+        b.vel[free] += acc[free] * dt
+
+
+def euler(b, dt, accel=gravity_accel):
+    """
+    Semi-implicit Euler: kick with the current accelerations, then drift.
+    First order, one force evaluation per step.
+    """
+    moving = b.begin_step()
+    kick(b, accel(b), dt)
+    b.drift(dt, moving)
+    b.apply_borders(moving)
+
+
+def leapfrog(b, dt, accel=gravity_accel):
+    """
+    Kick-drift-kick leapfrog. Second order and symplectic, the accelerations
+    are evaluated at both ends of every step (two force evaluations).
+    """
+    moving = b.begin_step()
+    kick(b, accel(b), dt / 2)
+    b.drift(dt, moving)
+    kick(b, accel(b), dt / 2)
+    b.apply_borders(moving)
+
+
+def verlet(b, dt, accel=gravity_accel):
+    """
+    Velocity Verlet: the same update as kick-drift-kick leapfrog, but the
+    accelerations at the end of a step are kept for the start of the next
+    one, so it costs a single force evaluation per step.
+    """
+    moving = b.begin_step()
+    kick(b, cached_accel(b, accel), dt / 2)
+    b.drift(dt, moving)
+    kick(b, cached_accel(b, accel), dt / 2)
+    b.apply_borders(moving)
+
+
+def yoshida4(b, dt, accel=gravity_accel):
+    """
+    4th order Yoshida / Forest-Ruth composition of three leapfrog steps,
+    three force evaluations per step.
+    """
+    moving = b.begin_step()
+    for i in range(3):
+        b.drift(YOSHIDA_DRIFT[i] * dt, moving)
+        kick(b, accel(b), YOSHIDA_KICK[i] * dt)
+    b.drift(YOSHIDA_DRIFT[3] * dt, moving)
+    b.apply_borders(moving)
+
+
+def block_levels(b, acc, dt, criterion=BLOCK_CRITERION, eta=BLOCK_ETA, max_level=BLOCK_MAX_LEVEL):
+    """
+    Picks the power of two timestep level of every body: the body steps with
+    dt / 2**level, where the level is the smallest one giving a step below
+    eta * |a| / |jerk| ("jerk") or eta * sqrt(radius / |a|) ("accel").
+    """
+    a = np.hypot(acc[:, 0], acc[:, 1])
+    if not a.any():
+        return np.zeros(len(b), dtype=np.int8)
+
+    if criterion == "jerk":
+        jerk = direct_jerk(b.pos, b.vel, b.mass, box=periodic_box())
+        j = np.hypot(jerk[:, 0], jerk[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            wanted = eta * a / j
+    elif criterion == "accel":
+        with np.errstate(divide="ignore"):
+            wanted = eta * np.sqrt(b.rad / a)
+    else:
+        raise ValueError("Unknown block timestep criterion: " + str(criterion))
+
+    # No acceleration or no jerk: the body can take the whole step
+    wanted[~np.isfinite(wanted) | (wanted <= 0)] = dt
+    with np.errstate(divide="ignore"):
+        level = np.ceil(np.log2(dt / wanted))
+    return np.clip(level, 0, max_level).astype(np.int8)
+
+
+def block(b, dt, accel=gravity_accel):
+    """
+    Hierarchical block timesteps with kick-drift-kick steps.
+
+    Every body gets a level and steps with dt / 2**level, so only the bodies
+    in close encounters are substepped. All the bodies are drifted together
+    at the finest level in use (drifting is cheap), but the forces are only
+    evaluated for the bodies whose own step ends at that moment. At the end
+    of dt every body is synchronized again and the levels are picked anew.
+    """
+    moving = b.begin_step()
+    n = len(b)
+
+    acc = cached_accel(b, accel)
+    b.level[:] = block_levels(b, acc, dt)
+
+    finest = int(b.level.max()) if n else 0
+    ticks = 2 ** finest
+    fine_dt = dt / ticks
+    span = 2 ** (finest - b.level.astype(np.int64))  # ticks per step of each body
+    body_dt = span * fine_dt
+    free = b.colliding == 0
+
+    # Opening half kick, every body starts synchronized
+    b.vel[free] += acc[free] * (body_dt[free, None] / 2)
+    evaluations = 0
+
+    for t in range(1, ticks + 1):
+        b.drift(fine_dt, moving)
+
+        active = np.flatnonzero(t % span == 0)
+        a = accel(b, active)
+        evaluations += len(active)
+
+        # Closing half kick, and the opening one of the next substep
+        kick_dt = body_dt[active] if t < ticks else body_dt[active] / 2
+        act_free = free[active]
+        b.vel[active[act_free]] += a[act_free] * kick_dt[act_free, None]
+
+    # The last substep evaluated every body, keep it for the next step
+    b.acc_cache = (b.pos.copy(), b.mass.copy(), a)
+    b.apply_borders(moving)
+
+    b.block_stats = {
+        "levels": np.bincount(b.level, minlength=BLOCK_MAX_LEVEL + 1),
+        "force_evaluations": evaluations,
+        # What a single global step at the finest level would have cost
+        "global_step_evaluations": n * ticks,
+    }
+
+
+def block_stats_text(b):
+    """
+    One line summary of the last block step: bodies per level and the force
+    evaluations saved compared to stepping everything at the finest level.
+    """
+    stats = b.block_stats
+    if stats is None:
+        return "no block step yet"
+
+    levels = " ".join(f"L{i}:{c}" for i, c in enumerate(stats["levels"]) if c)
+    saved = stats["global_step_evaluations"] / max(stats["force_evaluations"], 1)
+    return f"{levels}  force evals {stats['force_evaluations']} ({saved:.1f}x fewer than global)"
+
+
+INTEGRATORS = {
+    "euler": euler,
+    "leapfrog": leapfrog,
+    "verlet": verlet,
+    "yoshida4": yoshida4,
+    "block": block,
+}
+
+
+def integrate(b, dt=TIMESTEP, method=INTEGRATOR, accel=gravity_accel):
+    """
+    Advances the bodies by one step with the selected integrator.
+
+    Args:
+        b: The Particles store.
+        dt: The timestep.
+        method: One of the INTEGRATORS names.
+        accel: Callable returning the (N, 2) accelerations for a store.
+    """
+    if method not in INTEGRATORS:
+        raise ValueError("Unknown integrator: " + str(method))
+    INTEGRATORS[method](b, dt, accel)
+
+
+def total_energy(b, softening=GRAVITY_SOFTENING):
+    """
+    Kinetic plus gravitational potential energy of the bodies.
+    """
+    from func import calculate_kinetic_energy
+
+    kinetic = sum(calculate_kinetic_energy(b.mass.tolist(), b.vel.tolist()))
+    return kinetic + potential_energy(b.pos, b.mass, softening, box=periodic_box())
+
+
+def energy_drift_report(bodies, steps=2000, dt=TIMESTEP, methods=tuple(INTEGRATORS), dt_factors=(1, 5, 10, 20)):
+    """
+    Integrates copies of the bodies (gravity only, no collisions) with every
+    method and timestep multiplier, and prints the largest relative energy
+    error seen over the same span of simulated time.
+
+    Args:
+        bodies: The Particles store to start from (left untouched).
+        steps: Number of steps at the base timestep, the larger timesteps run
+            proportionally fewer steps.
+        dt: The base timestep.
+        methods: Integrator names to compare.
+        dt_factors: Multipliers of the base timestep to try.
+    """
+    def always_gravity(b, targets=None):
+        return gravity_accelerations(b.pos, b.mass, targets)
+
+    e0 = total_energy(bodies)
+    print(f"{len(bodies)} bodies, {steps * dt:.3f} time units, E0 = {e0:.4e}")
+    print("method        dt      steps   max |dE/E0|     ms/step")
+
+    for method in methods:
+        for factor in dt_factors:
+            b = bodies.copy()
+            n = max(1, steps // factor)
+            worst = 0.0
+
+            start = time.perf_counter()
+            for _ in range(n):
+                integrate(b, dt * factor, method, always_gravity)
+                worst = max(worst, abs((total_energy(b) - e0) / e0))
+            elapsed = time.perf_counter() - start
+
+            print(f"{method:10} {dt * factor:8.4f} {n:8d} {worst:13.3e} {elapsed / n * 1000:10.2f}")
+
+
+if __name__ == "__main__":
+    from particles import Particles
+
+    # A heavy central body with light bodies on circular orbits around it,
+    # small enough to stay away from the borders
+    rng = np.random.default_rng(0)
+    central_mass = 1e17
+    bodies = Particles(17)
+    bodies.add(screen_width / 2, screen_height / 2, 20, central_mass)
+
+    for r, phase in zip(np.linspace(100, 250, 16), rng.uniform(0, 2 * np.pi, 16)):
+        speed = math.sqrt(G * central_mass / r)
+        bodies.add(
+            screen_width / 2 + r * math.cos(phase), screen_height / 2 + r * math.sin(phase), 5, 1e12,
+            -speed * math.sin(phase), speed * math.cos(phase),
+        )
+
+    energy_drift_report(bodies)
@@ -0,0 +1,364 @@
+"""
+Compiled versions of the physics inner loops, built with Numba when it is
+installed.
+
+The kernels cover the whole step over the particle arrays: gravity, the
+semi-implicit Euler kick and drift, the reflection on the universe borders
+and the collision resolution, with the nearest image distances of periodic
+boundaries (wrapping and open boundaries use the NumPy code). They follow
+the NumPy path of func.step and integrators.py operation by operation, so
+switching PHYSICS_BACKEND gives the same simulation. Without Numba the
+kernels stay plain Python functions and step falls back to the NumPy path.
+
+Compiled kernels are cached on disk (cache=True), so only the very first
+launch pays for the compilation, and warm_up compiles them on a tiny
+system before the first frame instead of in the middle of it.
+"""
+import math
+
+from globals import *
+from spatial_grid import candidate_pairs
+from boundaries import pair_distances, periodic_box
+from integrators import integrate
+
+try:
+    import numba
+    from numba import prange
+
+    AVAILABLE = True
+except ImportError:
+    numba = None
+    prange = range
+    AVAILABLE = False
+
+
+def jit(parallel=False):
+    """
+    Compiles the decorated function with numba.njit when Numba is available,
+    returns it unchanged otherwise.
+    """
+
+    def decorate(function):
+        if not AVAILABLE:
+            return function
+        return numba.njit(cache=True, parallel=parallel, fastmath=JIT_FASTMATH)(function)
+
+    return decorate
+
+
+@jit()
+def _nearest(d, length):
+    # boundaries.minimum_image, length 0 for a non periodic axis
+    if length > 0:
+        return d - length * math.floor(d / length + 0.5)
+    return d
+
+
+@jit(parallel=True)
+def gravity_kernel(x, y, mass, eps2, gravitational_constant, acc, width=0.0, height=0.0):
+    """
+    Direct-sum gravitational accelerations of every body, stored in acc.
+    width and height are the size of the periodic box (0 when not periodic).
+    """
+    n = len(x)
+    for i in prange(n):
+        ax = 0.0
+        ay = 0.0
+        for k in range(n):
+            dx = _nearest(x[k] - x[i], width)
+            dy = _nearest(y[k] - y[i], height)
+            d2 = dx * dx + dy * dy
+
+            # Coincident bodies (and the body itself) do not contribute
+            if d2 < 1e-20:
+                continue
+
+            r2 = d2 + eps2
+            w = mass[k] / (r2 * math.sqrt(r2))
+            ax += w * dx
+            ay += w * dy
+
+        acc[i, 0] = ax * gravitational_constant
+        acc[i, 1] = ay * gravitational_constant
+
+
+@jit()
+def euler_kernel(pos, vel, acc, colliding, moving, dt):
+    """
+    Semi-implicit Euler step: kicks the free bodies and drifts the moving ones.
+    """
+    for i in range(len(pos)):
+        if colliding[i] == 0:
+            vel[i, 0] += acc[i, 0] * dt
+            vel[i, 1] += acc[i, 1] * dt
+        if moving[i]:
+            pos[i, 0] += vel[i, 0] * dt
+            pos[i, 1] += vel[i, 1] * dt
+
+
+@jit()
+def borders_kernel(pos, vel, rad, moving, border_cnt, wall_hit, width, height):
+    """
+    Reflects the moving bodies that crossed the universe borders, checking
+    right, left, bottom and top in that order like Particles.reflect.
+    """
+    for i in range(len(pos)):
+        if not moving[i]:
+            continue
+
+        hit = False
+        r = rad[i]
+        if pos[i, 0] > width - r:
+            pos[i, 0] = 2 * (width - r) - pos[i, 0]
+            vel[i, 0] = -vel[i, 0]
+            hit = True
+        if pos[i, 0] < r:
+            pos[i, 0] = 2 * r - pos[i, 0]
+            vel[i, 0] = -vel[i, 0]
+            hit = True
+        if pos[i, 1] > height - r:
+            pos[i, 1] = 2 * (height - r) - pos[i, 1]
+            vel[i, 1] = -vel[i, 1]
+            hit = True
+        if pos[i, 1] < r:
+            pos[i, 1] = 2 * r - pos[i, 1]
+            vel[i, 1] = -vel[i, 1]
+            hit = True
+
+        if hit:
+            border_cnt[i] = 3
+            wall_hit[i] = True
+
+
+@jit()
+def _bounce_speed(m, energy, vx_sample, vy_sample):
+    # func.get_velocity
+    v_ideal = math.sqrt(2 * energy / m)
+    total_v = vx_sample + vy_sample
+    if total_v != 0:
+        return vx_sample / total_v * v_ideal, vy_sample / total_v * v_ideal
+    return v_ideal / 2, v_ideal / 2
+
+
+@jit()
+def _bounce(m1, v1x, v1y, m2, v2x, v2y):
+    # func.elastic_collision
+    k1 = 1 / 2 * m1 * (math.pow(v1x, 2) + math.pow(v1y, 2))
+    k2 = 1 / 2 * m2 * (math.pow(v2x, 2) + math.pow(v2y, 2))
+
+    n1x = 0.0
+    n1y = 0.0
+    n2x = 0.0
+    n2y = 0.0
+    if (abs(v2x) + abs(v2y)) > 0:
+        n1x, n1y = _bounce_speed(m1, k2, v2x, v2y)
+    if (abs(v1x) + abs(v1y)) > 0:
+        n2x, n2y = _bounce_speed(m2, k1, v1x, v1y)
+    return n1x, n1y, n2x, n2y
+
+
+@jit()
+def _overlap(x, y, r, i, k, width, height):
+    # The negation of func.do_not_overlap
+    sx = _nearest(x[k] - x[i], width) - (x[k] - x[i])
+    sy = _nearest(y[k] - y[i], height) - (y[k] - y[i])
+    distance = ((x[i] - (x[k] + sx)) ** 2 + (y[i] - (y[k] + sy)) ** 2) ** 0.5
+    return not distance > r[i] + r[k]
+
+
+@jit()
+def collision_kernel(x, y, vx, vy, r, m, colliding, hits, neighbours, indptr, fixed, width=0.0, height=0.0):
+    """
+    Resolves the overlapping pairs in the order of func.univ_collision.
+
+    Pairs are encoded as i * n + k, which sorts like the (i, k) tuples.
+
+    Args:
+        hits: Keys of the overlapping (i, k) pairs, both orderings.
+        neighbours, indptr: Candidate neighbours of every body, CSR form.
+        fixed: Keys (i < k) of the pairs that bounced in the previous step.
+        width, height: Size of the periodic box, 0 when not periodic.
+
+    Returns:
+        tuple: (touching, still, bounced, changed) flags of the touching
+        bodies, keys of the fixed pairs still touching, keys of the new
+        bounced pairs and flags of the bodies that moved.
+    """
+    n = len(x)
+    pending = [hits[j] for j in range(len(hits))]
+    heapq.heapify(pending)
+    queued = set(pending)
+    already = set([fixed[j] for j in range(len(fixed))])
+
+    # Empty sets typed like the one above
+    still = set(already)
+    still.clear()
+    bounced = set(already)
+    bounced.clear()
+
+    touching = np.zeros(n, dtype=np.bool_)
+    changed = np.zeros(n, dtype=np.bool_)
+
+    while len(pending) > 0:
+        current = heapq.heappop(pending)
+        queued.discard(current)
+        i = current // n
+        k = current % n
+
+        # Earlier separations may already have pushed these two apart
+        if not _overlap(x, y, r, i, k, width, height):
+            continue
+
+        touching[i] = True
+        colliding[i] += 1
+        changed[i] = True
+        changed[k] = True
+
+        # func.separate_circles, on the image of k nearest to i
+        sx = _nearest(x[k] - x[i], width) - (x[k] - x[i])
+        sy = _nearest(y[k] - y[i], height) - (y[k] - y[i])
+        xk = x[k] + sx
+        yk = y[k] + sy
+        distance = math.sqrt((x[i] - xk) ** 2 + (y[i] - yk) ** 2)
+        min_distance = r[i] + r[k]
+        if distance < min_distance:
+            direction_x = xk - x[i]
+            direction_y = yk - y[i]
+            norm = math.sqrt(direction_x ** 2 + direction_y ** 2)
+            ux = 1.0
+            uy = 0.0
+            if norm > 0:
+                ux = direction_x / norm
+                uy = direction_y / norm
+            shift = (distance - min_distance) / 2
+            x[i] = x[i] + ux * shift
+            y[i] = y[i] + uy * shift
+            x[k] = x[k] - ux * shift
+            y[k] = y[k] - uy * shift
+
+        key = i * n + k if i < k else k * n + i
+        if key in already:
+            still.add(key)
+        else:
+            vx[i], vy[i], vx[k], vy[k] = _bounce(m[i], vx[i], vy[i], m[k], vx[k], vy[k])
+            already.add(key)
+            bounced.add(key)
+
+        for moved in (i, k):
+            for j in range(indptr[moved], indptr[moved + 1]):
+                other = neighbours[j]
+                if not _overlap(x, y, r, moved, other, width, height):
+                    continue
+                for pair in (moved * n + other, other * n + moved):
+                    if pair > current and pair not in queued:
+                        heapq.heappush(pending, pair)
+                        queued.add(pair)
+
+    return touching, np.array(list(still), dtype=np.int64), np.array(list(bounced), dtype=np.int64), changed
+
+
+def accelerations(b):
+    """
+    Gravitational accelerations of all the bodies with the compiled kernel.
+    """
+    acc = np.zeros((len(b), 2))
+    if GRAVITY_ENABLED and len(b) > 0:
+        pos = np.ascontiguousarray(b.pos)
+        width, height = periodic_box() or (0.0, 0.0)
+        gravity_kernel(pos[:, 0].copy(), pos[:, 1].copy(), b.mass, GRAVITY_SOFTENING ** 2, G, acc, width, height)
+    return acc
+
+
+def collide(b, ind_fixed):
+    """
+    Same as func.univ_collision, with the pair loop in collision_kernel.
+    """
+    n = len(b)
+    pos = b.pos
+    rad = b.rad
+
+    box = periodic_box()
+    cand_i, cand_k = candidate_pairs(pos, rad, box=box)
+
+    src = np.concatenate((cand_i, cand_k))
+    dst = np.concatenate((cand_k, cand_i))
+    by_src = np.argsort(src, kind="stable")
+    neighbours = dst[by_src]
+    indptr = np.searchsorted(src[by_src], np.arange(n + 1))
+
+    d = pair_distances(pos, cand_i, cand_k, box)
+    hit = d <= rad[cand_i] + rad[cand_k]
+    if not hit.any():
+        b.colliding[:] = 0
+        return set()
+
+    hi = cand_i[hit]
+    hk = cand_k[hit]
+    hits = np.concatenate((hi * n + hk, hk * n + hi))
+    fixed = np.array([i * n + k for i, k in ind_fixed], dtype=np.int64)
+
+    x = pos[:, 0].copy()
+    y = pos[:, 1].copy()
+    vx = b.vel[:, 0].copy()
+    vy = b.vel[:, 1].copy()
+
+    width, height = box or (0.0, 0.0)
+    touching, still, bounced, changed = collision_kernel(
+        x, y, vx, vy, rad, b.mass, b.colliding, hits, neighbours, indptr, fixed, width, height
+    )
+
+    pos[changed, 0] = x[changed]
+    pos[changed, 1] = y[changed]
+    b.vel[changed, 0] = vx[changed]
+    b.vel[changed, 1] = vy[changed]
+    b.colliding[~touching] = 0
+
+    ind_fixed.update(zip((bounced // n).tolist(), (bounced % n).tolist()))
+    return set(zip((still // n).tolist(), (still % n).tolist()))
+
+
+def step(b, ind_fixed):
+    """
+    One physics step with the compiled kernels, same contract as func.step.
+    """
+    b.prev_pos[:] = b.pos
+    advance(b)
+    return collide(b, ind_fixed)
+
+
+def advance(b):
+    """
+    Gravity and motion for one TIMESTEP. Integrators other than "euler" run
+    their NumPy scheme with the compiled gravity.
+    """
+    if INTEGRATOR == "euler":
+        moving = b.begin_step()
+        euler_kernel(b.pos, b.vel, accelerations(b), b.colliding, moving, TIMESTEP)
+        if BOUNDARY_MODE == "reflect":
+            borders_kernel(b.pos, b.vel, b.rad, moving, b.border_cnt, b.wall_hit, screen_width, screen_height)
+        else:
+            b.apply_borders(moving)
+    else:
+        integrate(b, TIMESTEP, accel=lambda bodies, targets=None: gravity_subset(bodies, targets))
+
+
+def gravity_subset(b, targets=None):
+    acc = accelerations(b)
+    return acc if targets is None else acc[targets]
+
+
+def warm_up():
+    """
+    Compiles (or loads from the cache) every kernel on a tiny system, so the
+    first frame does not wait for the compiler.
+    """
+    if not AVAILABLE:
+        return
+
+    from particles import Particles
+
+    b = Particles(2, trail_length=0)
+    b.add(10, 10, 5, 1, 1, 0)
+    b.add(18, 10, 5, 1, -1, 0)
+    gravity_kernel(b.pos[:, 0].copy(), b.pos[:, 1].copy(), b.mass, 0.0, G, np.zeros((2, 2)), 0.0, 0.0)
+    step(b, set())
@@ -1,22 +1,31 @@
-print("The program is loading please wait...\n\n\n")
+if __name__ == "__main__":
+    print("The program is loading please wait...\n\n\n")
 
 from globals import *
 from body import *
 from func import *
+from render import *
 from settings import *
-from shared_list import *
+from snapshot import *
+from commands import *
+from scheduler import *
+from simulation import *
+from physics_worker import *
+from profiling import *
+import os
 import traceback
 from sys import exit
 
 
 
 def mainloop():
+    screen = get_screen()
     clock = pygame.time.Clock()
-    shared_list = SharedList()
-    
+    publisher = SnapshotPublisher()
+
 
 
-    args = (shared_list,)
+    args = (publisher,)
     ct = threading.Thread(target=control_thread, args=args)
     ct.start()
     
@@ -39,16 +48,13 @@ def mainloop():
     
     for i in range(len(b)):
         b[i].clear_trajectory()
-        shared_list.add(b[i])
 
 
 
     running = True
     i = 0
-    tmp = []
 
     masses = [x.mass for x in b]
-    new_calc = True
 
     if(not GRAVITY_ENABLED):
         print("Warning gravity not enabled")
@@ -64,9 +70,31 @@ def mainloop():
     
     mouse_wheel_factor = 2
     current_zoom = 1
+
+    draw_mode = DRAW_MODE
+    density_map = DensityMap()
     
+    if PHYSICS_WORKER:
+        # The physics runs in its own process, b becomes the read only view
+        # of the state it publishes and the commands are forwarded to it
+        worker = PhysicsWorker(b)
+        b = worker.view
+        publisher.publish(b, b.step_count)
+    else:
+        worker = None
+        sim = Simulation(b, publisher)
+        command_log = CommandLog() if COMMAND_LOG_PATH else None
+        scheduler = FixedStepScheduler()
+
+    timer = FrameTimer()
+    hud = FrameHud(timer)
+    capture = ProfileCapture()
+    if worker is None:
+        sim.timer = timer
+    last_frame = time.perf_counter()
     
     while not pygame_terminate:
+        timer.begin_frame()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -84,37 +112,37 @@ def mainloop():
                     now = pygame.mouse.get_pos()
                     #print("End at", now)
                     
-                    total_xy_off = (total_xy_off[0]-(start_moving_space[0]-now[0]), total_xy_off[1]-(start_moving_space[1]-now[1]))
+                    total_xy_off = (total_xy_off[0]-(start_moving_space[0]-now[0])/current_zoom, total_xy_off[1]-(start_moving_space[1]-now[1])/current_zoom)
                     #print("Offset", total_xy_off)
                 
                 if(elem_clicked):
                     elem_clicked = False
-                    shared_list.get(elem_idx).vx = 0
-                    shared_list.get(elem_idx).vy = 0
+                    control_queue.put(SetProperty(elem_idx, "vx", 0))
+                    control_queue.put(SetProperty(elem_idx, "vy", 0))
                     
                     mouse_x, mouse_y = pygame.mouse.get_pos()
                     mouse_data.append({'x': mouse_x, 'y': mouse_y, 'timestamp': time.time()})
                     
                     acc = [k * 1 for k in get_drag_acceleration(mouse_data, 3000)]
                     
-                    shared_list.get(elem_idx).accel(acc[0]*TIMESTEP, acc[1]*TIMESTEP)
+                    control_queue.put(ApplyImpulse(elem_idx, acc[0]*TIMESTEP, acc[1]*TIMESTEP))
                     
-                    shared_list.get(elem_idx).clear_trajectory()
+                    control_queue.put(ClearTrail(elem_idx))
                 
                     
                 mouse_data = []
-                control_queue.put("resume")
+                control_queue.put(Resume())
                 
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                 is_button_held = True
                 
-                control_queue.put("paused")
+                control_queue.put(Pause())
                 mouse_x, mouse_y = pygame.mouse.get_pos()
+                world_x, world_y = to_world((mouse_x, mouse_y), total_xy_off, current_zoom)
                 #print("Clicked", mouse_x, mouse_y)
-                #print("Adjusted click", mouse_x-total_xy_off[0], mouse_y-total_xy_off[1])
                 
-                for i in range(shared_list.size()):
-                    test = is_click_in_circle(mouse_x-total_xy_off[0], mouse_y-total_xy_off[1], shared_list.get(i).x, shared_list.get(i).y, shared_list.get(i).radius)
+                for i in range(len(b)):
+                    test = is_click_in_circle(world_x, world_y, b[i].x, b[i].y, b[i].radius)
                     #print("Elem ",i,"clicked?", test)
                     if(test):
                         elem_clicked = True
@@ -131,13 +159,38 @@ def mainloop():
                 
                 if(elem_clicked):
                     #print("Dragging", elem_idx)
-                    shared_list.get(elem_idx).x = mouse_x-total_xy_off[0]
-                    shared_list.get(elem_idx).y =  mouse_y-total_xy_off[1]
+                    world_x, world_y = to_world((mouse_x, mouse_y), total_xy_off, current_zoom)
+                    control_queue.put(SetProperty(elem_idx, "x", world_x))
+                    control_queue.put(SetProperty(elem_idx, "y", world_y))
                     pass
                 else:
                    # print("Draggin nothing")
                    pass
             
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_h:
+                draw_mode = "density" if draw_mode == "bodies" else "bodies"
+                density_map.reset()
+                print("Draw mode", draw_mode)
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                timer.enabled = not timer.enabled
+                timer.reset()
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                path = os.path.join(PROFILE_DIR, time.strftime("frames-%Y%m%d-%H%M%S.csv"))
+                timer.save_csv(path)
+                print("Frame timings written to", path)
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                capture.start()
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                control_queue.put(SaveCheckpoint())
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                control_queue.put(LoadCheckpoint())
+
             if (event.type == pygame.MOUSEWHEEL) and ZOOM_ENABLED:
                 # Access the 'y' attribute to determine scroll direction
                 scroll_amount = event.y
@@ -149,44 +202,82 @@ def mainloop():
                     print("Scrolling Down", current_zoom)
 
 
-        screen.fill(BLACK)
+        timer.lap("events")
 
-        draw_axes(screen, screen_width, screen_height,  total_xy_off, RED)
+        now = time.perf_counter()
+        frame_time = now - last_frame
+        last_frame = now
 
-        for elem in b:
-            elem.draw(total_xy_off, current_zoom)
+        if(worker is not None):
+            while True:
+                try:
+                    worker.send(control_queue.get(block=False))
+                except queue.Empty:
+                    break
+            timer.lap("commands")
 
-        pygame.display.flip()
+            last_step = b.step_count
+            if worker.update():
+                publisher.publish(b, b.step_count)
+            timer.steps(b.step_count - last_step)
+            timer.lap("sync")
+            alpha = 1.0
+        else:
+            # Everything the GUI and the mouse sent since the last frame,
+            # applied in one batch before the physics steps
+            drain_commands(sim, control_queue, command_log)
+            timer.lap("commands")
 
-        clock.tick(60)
+            # Physics runs on its own fixed clock, as many steps as are due
+            if(not sim.paused):
+                timer.steps(scheduler.run(frame_time, sim.step))
+                alpha = scheduler.alpha
+            else:
+                scheduler.reset()
+                alpha = 1.0
+            timer.lap("physics")
 
+        axes_off = (total_xy_off[0]*current_zoom, total_xy_off[1]*current_zoom)
 
-        
-        try:
-            item = control_queue.get(block=False)
-            if(item == "paused"):
-                new_calc = False
-                #print("Pausing")
-            elif(item == "resume"):
-                new_calc = True
-                #print("Resuming")
-            # Process the item:
-        except queue.Empty:
-            # Handle the case where the queue is empty (optional)
-            pass
-        
-        if(new_calc):
-            calc_forces(b)
-            tmp = univ_collision(b, tmp)
+        if(draw_mode == "density"):
+            # The heatmap covers the whole screen, the axes go on top
+            density_map.draw(b, total_xy_off, current_zoom, alpha)
+            draw_axes(screen, screen_width, screen_height, axes_off, RED)
+        else:
+            screen.fill(BLACK)
+            draw_axes(screen, screen_width, screen_height, axes_off, RED)
+            draw_bodies(b, total_xy_off, current_zoom, alpha)
+        timer.lap("draw")
 
+        if(timer.enabled):
+            hud.draw(screen)
+            timer.lap("hud")
 
-    pygame.quit()
+        pygame.display.flip()
+        timer.lap("flip")
 
-try:
-    mainloop()
-except Exception as e:  # Catch any exception
-    print("An error occurred:", e)  # Print the exception message
-    traceback.print_exc()
+        clock.tick(FPS)
+        timer.lap("wait")
+        timer.end_frame()
+        capture.frame_done()
+
+
+    if worker is not None:
+        worker.stop()
+    elif command_log is not None:
+        command_log.save(COMMAND_LOG_PATH)
+        print("Command log written to", COMMAND_LOG_PATH)
 
     pygame.quit()
-    exit(1)
\ No newline at end of file
+
+# The physics worker is started with spawn, which imports this file again
+# in the new process, so the program itself only runs as __main__
+if __name__ == "__main__":
+    try:
+        mainloop()
+    except Exception as e:  # Catch any exception
+        print("An error occurred:", e)  # Print the exception message
+        traceback.print_exc()
+
+        pygame.quit()
+        exit(1)
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Direct-sum gravity split into tiles of target bodies and computed on
+several cores.
+
+The positions and masses are copied once per evaluation into a block of
+multiprocessing.shared_memory, and every pool process reads them from
+there without copying. The process then writes the accelerations of its
+tile into the same block. Only the tile bounds travel through the pool.
+With pool="thread" the tiles run on threads instead. NumPy releases the
+GIL inside the big array operations, so threads scale too, with no
+process start-up and no copy at all.
+
+    python parallel_gravity.py
+
+runs the scaling benchmark (N = 1k, 5k, 20k, from 1 worker to all cores).
+"""
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+from globals import *
+from gravity import direct_accelerations
+
+
+class ForceBuffers:
+    """
+    Shared memory block with room for the positions, masses and
+    accelerations of `capacity` bodies.
+    """
+
+    def __init__(self, capacity, name=None):
+        self.capacity = capacity
+        size = capacity * 5 * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.name = self.shm.name
+        buf = self.shm.buf
+        self.pos = np.ndarray((capacity, 2), dtype=np.float64, buffer=buf)
+        self.mass = np.ndarray((capacity,), dtype=np.float64, buffer=buf, offset=capacity * 16)
+        self.acc = np.ndarray((capacity, 2), dtype=np.float64, buffer=buf, offset=capacity * 24)
+
+    def close(self):
+        self.pos = self.mass = self.acc = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# Blocks attached by this pool process, by name
+_attached = {}
+
+
+def _tile_task(name, capacity, n, start, end, targets, softening, gravitational_constant, box=None):
+    """
+    Runs in a pool process: computes the accelerations of one tile and
+    stores them in rows start:end of the shared acc array.
+    """
+    buffers = _attached.get(name)
+    if buffers is None:
+        # The pool moved to a new block, the old ones are not used anymore
+        for old in _attached.values():
+            old.close()
+        _attached.clear()
+        buffers = _attached[name] = ForceBuffers(capacity, name)
+
+    if targets is None:
+        targets = np.arange(start, end)
+    buffers.acc[start:end] = direct_accelerations(
+        buffers.pos[:n], buffers.mass[:n], targets, softening, gravitational_constant=gravitational_constant, box=box
+    )
+
+
+class TiledGravity:
+    """
+    Direct-sum gravity computed in tiles of target bodies on a pool of
+    processes or threads.
+    """
+
+    def __init__(self, workers=FORCE_WORKERS, tile_size=FORCE_TILE_SIZE, pool=FORCE_POOL):
+        """
+        Args:
+            workers: Number of pool workers, all the cores when None.
+            tile_size: Target bodies per task.
+            pool: "process" or "thread".
+        """
+        if pool not in ("process", "thread"):
+            raise ValueError("Unknown pool type: " + str(pool))
+
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        self.pool = pool
+        self._executor = None
+        self._buffers = None
+
+    def executor(self):
+        if self._executor is None:
+            if self.pool == "process":
+                # spawn, the physics may already run threads or be a worker itself
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers)
+        return self._executor
+
+    def tiles(self, count):
+        return [(start, min(start + self.tile_size, count)) for start in range(0, count, self.tile_size)]
+
+    def accelerations(self, pos, mass, targets=None, softening=GRAVITY_SOFTENING, gravitational_constant=G, box=None):
+        """
+        Same result as gravity.direct_accelerations, computed in parallel.
+
+        Args:
+            pos (np.ndarray): (N, 2) positions of all the bodies.
+            mass (np.ndarray): (N,) masses of all the bodies.
+            targets (np.ndarray): Indices of the bodies to compute the
+                acceleration for (default: all of them).
+            box (tuple): (width, height) of the periodic box, if any.
+
+        Returns:
+            np.ndarray: (len(targets), 2) accelerations.
+        """
+        n = len(pos)
+        count = n if targets is None else len(targets)
+        if count == 0 or n == 0:
+            return np.zeros((count, 2))
+
+        tiles = self.tiles(count)
+        if len(tiles) == 1 or self.workers == 1:
+            return direct_accelerations(pos, mass, targets, softening, gravitational_constant=gravitational_constant, box=box)
+
+        if self.pool == "thread":
+            return self._thread_accelerations(pos, mass, targets, tiles, softening, gravitational_constant, box)
+
+        capacity = max(n, count)
+        if self._buffers is None or self._buffers.capacity < capacity:
+            if self._buffers is not None:
+                capacity = max(capacity, 2 * self._buffers.capacity)
+                self._buffers.close()
+            self._buffers = ForceBuffers(capacity)
+
+        buffers = self._buffers
+        buffers.pos[:n] = pos
+        buffers.mass[:n] = mass
+
+        futures = [
+            self.executor().submit(
+                _tile_task, buffers.name, buffers.capacity, n, start, end,
+                None if targets is None else targets[start:end], softening, gravitational_constant, box,
+            )
+            for start, end in tiles
+        ]
+        for future in futures:
+            future.result()
+
+        return buffers.acc[:count].copy()
+
+    def _thread_accelerations(self, pos, mass, targets, tiles, softening, gravitational_constant, box=None):
+        acc = np.empty((len(pos) if targets is None else len(targets), 2))
+
+        def run(tile):
+            start, end = tile
+            tile_targets = np.arange(start, end) if targets is None else targets[start:end]
+            acc[start:end] = direct_accelerations(
+                pos, mass, tile_targets, softening, gravitational_constant=gravitational_constant, box=box
+            )
+
+        list(self.executor().map(run, tiles))
+        return acc
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._buffers is not None:
+            self._buffers.close()
+            self._buffers = None
+
+
+_default = None
+
+
+def parallel_accelerations(pos, mass, targets=None, softening=GRAVITY_SOFTENING, gravitational_constant=G, box=None):
+    """
+    Direct-sum accelerations on the shared TiledGravity configured by
+    FORCE_WORKERS, FORCE_TILE_SIZE and FORCE_POOL.
+    """
+    global _default
+    if _default is None:
+        _default = TiledGravity()
+        atexit.register(_default.close)
+    return _default.accelerations(pos, mass, targets, softening, gravitational_constant, box)
+
+
+def scaling_benchmark(sizes=(1000, 5000, 20000), pool=FORCE_POOL, tile_size=FORCE_TILE_SIZE, repeat=3, seed=0):
+    """
+    Prints the time of one force evaluation for every N in `sizes`, from 1
+    worker up to all the cores, and the speedup over the single worker.
+    """
+    cores = os.cpu_count() or 1
+    counts = sorted({1, cores} | {2 ** k for k in range(1, cores.bit_length()) if 2 ** k < cores})
+    rng = np.random.default_rng(seed)
+
+    print(f"{pool} pool, tile size {tile_size}, {cores} cores")
+    for n in sizes:
+        pos = rng.uniform(0, 1000, (n, 2))
+        mass = rng.uniform(1, 10, n)
+        reference = direct_accelerations(pos, mass)
+        base = None
+
+        for workers in counts:
+            solver = TiledGravity(workers, tile_size, pool)
+            acc = solver.accelerations(pos, mass)  # also starts the pool
+            assert np.allclose(acc, reference, rtol=1e-12, atol=0)
+
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                solver.accelerations(pos, mass)
+                times.append(time.perf_counter() - start)
+            solver.close()
+
+            best = min(times)
+            base = base or best
+            print(f"  N={n:6d}  workers={workers:3d}  {best * 1000:9.1f} ms  speedup {base / best:5.2f}x")
+
+
+if __name__ == "__main__":
+    scaling_benchmark()
+    scaling_benchmark(pool="thread")
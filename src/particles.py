@@ -0,0 +1,337 @@
+from globals import *
+from body import Body
+
+
+class Particles:
+    """
+    Structure-of-arrays store holding the state of every body in the simulation.
+
+    Every per-body quantity lives in its own contiguous NumPy array (one row per
+    body), so the physics, collision and rendering code can work on the whole
+    system at once instead of reading Body attributes one at a time.
+    Indexing the store returns a Body view bound to that row, which is what the
+    mouse-drag and Tk editing paths use.
+    """
+
+    # name, per-body shape, dtype
+    FIELDS = (
+        ("pos", (2,), np.float64),
+        ("prev_pos", (2,), np.float64),  # positions before the last step
+        ("vel", (2,), np.float64),
+        ("mass", (), np.float64),
+        ("rad", (), np.float64),
+        ("color", (3,), np.uint8),
+        ("colliding", (), np.int32),
+        ("border_cnt", (), np.int32),
+        ("wall_hit", (), np.bool_),  # reflected on a universe border during this step
+        ("skip", (), np.bool_),
+        ("level", (), np.int8),  # block timestep level, see integrators.block
+        ("trail_count", (), np.int32),  # number of valid points in the trail
+    )
+
+    def __init__(self, capacity=16, trail_length=TRAIL_LENGHT):
+        self.n = 0
+        self.capacity = 0
+        self.trail_length = trail_length
+        self.trail_head = 0
+
+        # Every body owns a circular buffer of its last trail_length positions.
+        # Each point is written twice, at head and at head + trail_length, so
+        # the most recent trail_length points are always one contiguous slice
+        # and can be read without copying.
+        self.fields = self.FIELDS
+        if trail_length > 0:
+            self.fields += (("trail", (2 * trail_length, 2), np.float32),)
+
+        self.acc_cache = None  # (positions, masses, accelerations) of the last force evaluation
+        self.block_stats = None
+        self._buffers = {}
+        self._grow(max(capacity, 1))
+
+    def _alloc(self, name, shape, dtype):
+        return np.zeros(shape, dtype=dtype)
+
+    def _grow(self, capacity):
+        """
+        Reallocates every field buffer to hold `capacity` bodies, keeping the
+        current contents.
+        """
+        for name, shape, dtype in self.fields:
+            new = self._alloc(name, (capacity,) + shape, dtype)
+            old = self._buffers.get(name)
+            if old is not None:
+                new[:self.n] = old[:self.n]
+            self._buffers[name] = new
+
+        self.capacity = capacity
+        self._reslice()
+
+    def _reslice(self):
+        # The public attributes are views of the first n rows of each buffer,
+        # so in-place NumPy operations on them write straight into the store.
+        for name, _, _ in self.fields:
+            setattr(self, name, self._buffers[name][:self.n])
+
+    def copy(self):
+        """
+        Returns an independent copy of the store.
+        """
+        other = Particles(self.n, self.trail_length)
+        other.n = self.n
+        other.trail_head = self.trail_head
+        for name, _, _ in self.fields:
+            other._buffers[name][:self.n] = self._buffers[name][:self.n]
+        other._reslice()
+        return other
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError("body index out of range")
+        return Body(self, index)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield Body(self, i)
+
+    def add(self, x, y, radius, mass=0, vx=0, vy=0, color=WHITE):
+        """
+        Appends a body to the store, clamping its position inside the screen.
+
+        Returns:
+            The index of the new body.
+        """
+        if x < radius:
+            x = radius
+
+        if y < radius:
+            y = radius
+
+        if x > screen_width:
+            x = screen_width
+
+        if y > screen_height:
+            y = screen_height
+
+        if self.n == self.capacity:
+            self._grow(self.capacity * 2)
+
+        self.acc_cache = None
+
+        i = self.n
+        for name, _, _ in self.fields:
+            self._buffers[name][i] = 0
+
+        self.n += 1
+        self._reslice()
+
+        self.pos[i] = (x, y)
+        self.prev_pos[i] = (x, y)
+        self.vel[i] = (vx, vy)
+        self.mass[i] = mass
+        self.rad[i] = radius
+        self.color[i] = color
+        return i
+
+    def remove(self, index):
+        """
+        Removes a body, shifting the following rows down by one.
+        """
+        for name, _, _ in self.fields:
+            buf = self._buffers[name]
+            buf[index:self.n - 1] = buf[index + 1:self.n]
+
+        self.n -= 1
+        self.acc_cache = None
+        self._reslice()
+
+    def load(self, arrays):
+        """
+        Replaces every body with the ones described by `arrays`, a dict of
+        equally long field arrays (the missing fields are zeroed). The trails
+        start empty.
+        """
+        n = len(arrays["pos"])
+        if n > self.capacity:
+            self._grow(n)
+
+        self.n = n
+        self.acc_cache = None
+        self.block_stats = None
+        self._reslice()
+
+        for name, _, _ in self.fields:
+            if name in arrays:
+                getattr(self, name)[:] = arrays[name]
+            else:
+                getattr(self, name)[:] = 0
+
+    def push_trails(self):
+        """
+        Appends the current position of every body to its trail.
+        """
+        length = self.trail_length
+        if length == 0:
+            return
+
+        h = self.trail_head
+        self.trail[:, h] = self.pos
+        self.trail[:, h + length] = self.pos
+        self.trail_head = (h + 1) % length
+        np.minimum(self.trail_count + 1, length, out=self.trail_count)
+
+    def trail_points(self, index):
+        """
+        Returns the trail of a body, oldest point first, as a view into the
+        circular buffer (no copy).
+        """
+        if self.trail_length == 0:
+            return np.zeros((0, 2), dtype=np.float32)
+
+        end = self.trail_head + self.trail_length
+        return self.trail[index, end - self.trail_count[index]:end]
+
+    def clear_trajectory(self, index):
+        self.trail_count[index] = 0
+
+    def render_pos(self, alpha=1.0):
+        """
+        Positions interpolated between the previous and the current step.
+
+        Args:
+            alpha: Fraction of a step elapsed since the last physics step.
+        """
+        if alpha >= 1.0:
+            return self.pos
+        return self.prev_pos + alpha * (self.pos - self.prev_pos)
+
+    def begin_step(self):
+        """
+        Records the current positions in the trails and returns the mask of
+        the bodies that move during this step (the ones not marked with skip).
+        """
+        moving = ~self.skip
+        self.skip[:] = False
+        self.wall_hit[:] = False
+        self.push_trails()
+        return moving
+
+    def drift(self, dt, moving=None):
+        """
+        Moves the bodies along their velocity for dt.
+        """
+        if moving is None or moving.all():
+            self.pos += self.vel * dt
+        else:
+            self.pos[moving] += self.vel[moving] * dt
+
+    def update_pos(self, dt=TIMESTEP):
+        """
+        Moves every body by its velocity over one timestep and applies the
+        boundary conditions.
+        """
+        moving = self.begin_step()
+        self.drift(dt, moving)
+        self.apply_borders(moving)
+
+    def apply_borders(self, moving=None, mode=BOUNDARY_MODE):
+        """
+        Applies the boundary conditions of `mode` (see boundaries.py) to the
+        whole system at once. Open boundaries do nothing here, the bodies
+        that flew away are removed by func.remove_escaped.
+        """
+        if mode == "reflect":
+            self.reflect(moving)
+        elif mode == "periodic":
+            self.wrap()
+        elif mode != "open":
+            raise ValueError("Unknown boundary mode: " + str(mode))
+
+    def reflect(self, moving=None):
+        """
+        Reflects the bodies that crossed the universe borders back inside,
+        flipping the matching velocity component.
+        """
+        if moving is None:
+            moving = np.ones(self.n, dtype=bool)
+
+        x = self.pos[:, 0]
+        y = self.pos[:, 1]
+        vx = self.vel[:, 0]
+        vy = self.vel[:, 1]
+        rad = self.rad
+        hit = np.zeros(self.n, dtype=bool)
+
+        # Same order as the original scalar checks: right, left, bottom, top
+        side = moving & (x > screen_width - rad)
+        x[side] = 2 * (screen_width - rad[side]) - x[side]
+        vx[side] = -vx[side]
+        hit |= side
+
+        side = moving & (x < rad)
+        x[side] = 2 * rad[side] - x[side]
+        vx[side] = -vx[side]
+        hit |= side
+
+        side = moving & (y > screen_height - rad)
+        y[side] = 2 * (screen_height - rad[side]) - y[side]
+        vy[side] = -vy[side]
+        hit |= side
+
+        side = moving & (y < rad)
+        y[side] = 2 * rad[side] - y[side]
+        vy[side] = -vy[side]
+        hit |= side
+
+        self.border_cnt[hit] = 3
+        self.wall_hit |= hit
+
+    def wrap(self):
+        """
+        Brings the bodies that left the periodic box back in from the
+        opposite side. Their previous positions and trails move with them,
+        so the interpolation and the trails do not jump across the screen.
+        """
+        box = np.array((screen_width, screen_height), dtype=np.float64)
+        shift = np.floor(self.pos / box) * box
+        wrapped = np.flatnonzero(shift.any(axis=1))
+        if len(wrapped) == 0:
+            return
+
+        shift = shift[wrapped]
+        self.pos[wrapped] -= shift
+        self.prev_pos[wrapped] -= shift
+        self.shift_trails(wrapped, -shift)
+
+    def shift_trails(self, index, offset):
+        """
+        Moves every point of the trails of the `index` bodies by `offset`.
+        """
+        if self.trail_length > 0:
+            self.trail[index] += offset[:, None, :].astype(np.float32)
+
+    def compact(self, keep):
+        """
+        Removes every body not in the `keep` mask at once, keeping the order
+        of the others.
+
+        Returns:
+            np.ndarray: The new index of every old body, -1 for the removed ones.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        count = int(keep.sum())
+        new_index = np.full(self.n, -1, dtype=np.int64)
+        new_index[keep] = np.arange(count)
+
+        for name, _, _ in self.fields:
+            buf = self._buffers[name]
+            buf[:count] = buf[:self.n][keep]
+
+        self.n = count
+        self.acc_cache = None
+        self._reslice()
+        return new_index
@@ -0,0 +1,374 @@
+"""
+Runs the physics in a separate process, so the simulation and the pygame
+rendering each get a core of their own instead of sharing one GIL.
+
+The worker process owns the Particles store and the Simulation. After the
+physics steps it copies the state the renderer needs into a block of
+multiprocessing.shared_memory, and the pygame process draws straight from
+NumPy views of that block, without copying or unpickling anything. The
+commands of commands.py travel to the worker on a multiprocessing.Queue,
+which replaces control_queue as the way into the simulation.
+
+The shared block holds three slots. The worker writes into a slot that is
+neither the last published one nor the one the reader holds, then makes it
+the published one, so the reader never sees a half written step.
+"""
+import atexit
+from multiprocessing import get_context, parent_process, shared_memory
+
+from globals import *
+from particles import Particles
+from boundaries import image_shift, periodic_box
+from simulation import Simulation
+from scheduler import FixedStepScheduler
+from commands import *
+
+# Fields of the published state: name, per-body shape, dtype
+STATE_FIELDS = (
+    ("pos", (2,), np.float64),
+    ("vel", (2,), np.float64),
+    ("mass", (), np.float64),
+    ("rad", (), np.float64),
+    ("color", (3,), np.uint8),
+)
+
+SLOTS = 3
+
+# Header entries (int64)
+ACTIVE = 0  # slot published last
+READING = 1  # slot the reader is using
+SEQ = 2  # number of publishes so far
+COUNT = 3  # bodies in each slot, SLOTS entries
+STEP = COUNT + SLOTS  # step count of each slot, SLOTS entries
+SLOT_SEQ = STEP + SLOTS  # publish number of each slot, SLOTS entries
+HEADER_SIZE = SLOT_SEQ + SLOTS
+
+
+class SharedState:
+    """
+    The triple-buffered shared memory block the worker publishes into.
+    """
+
+    def __init__(self, capacity, name=None):
+        """
+        Args:
+            capacity: Most bodies a slot can hold.
+            name: Name of an existing block to attach to, a new block is
+                created when None.
+        """
+        self.capacity = capacity
+
+        offsets = []
+        size = HEADER_SIZE * 8
+        for _ in range(SLOTS):
+            slot = {}
+            for field, shape, dtype in STATE_FIELDS:
+                slot[field] = size
+                nbytes = capacity * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+                size += (nbytes + 7) // 8 * 8  # keep every array 8 byte aligned
+            offsets.append(slot)
+
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # The spawned worker shares the resource tracker of the pygame
+            # process, so the block stays registered once and is released
+            # by the unlink of its owner
+            self.owner = False
+
+        self.name = self.shm.name
+        self.header = np.ndarray((HEADER_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+        self.slots = []
+        for slot in offsets:
+            arrays = {}
+            for field, shape, dtype in STATE_FIELDS:
+                arrays[field] = np.ndarray((capacity,) + shape, dtype=dtype, buffer=self.shm.buf, offset=slot[field])
+            self.slots.append(arrays)
+
+        if self.owner:
+            self.header[:] = 0
+            self.header[READING] = -1
+
+    def write(self, bodies, step):
+        """
+        Publishes the state of `bodies` (worker side).
+        """
+        n = len(bodies)
+        active = self.header[ACTIVE]
+        reading = self.header[READING]
+        slot = next(s for s in range(SLOTS) if s != active and s != reading)
+
+        arrays = self.slots[slot]
+        for field, _, _ in STATE_FIELDS:
+            arrays[field][:n] = getattr(bodies, field)
+
+        self.header[COUNT + slot] = n
+        self.header[STEP + slot] = step
+        # The publish number goes with the slot before the slot goes public,
+        # so the reader always gets the one of the slot it took
+        self.header[SEQ] += 1
+        self.header[SLOT_SEQ + slot] = self.header[SEQ]
+        self.header[ACTIVE] = slot
+
+    def read(self):
+        """
+        Takes the last published slot (reader side). The slot is not written
+        again until the next call to read.
+
+        Returns:
+            tuple: (arrays, step, seq), arrays maps the field names to views
+            of the first n rows of the slot, seq is the publish number of
+            the slot.
+        """
+        while True:
+            slot = self.header[ACTIVE]
+            self.header[READING] = slot
+            # The worker may have published again in between, take the new one
+            if self.header[ACTIVE] == slot:
+                break
+
+        n = self.header[COUNT + slot]
+        arrays = {field: a[:n] for field, a in self.slots[slot].items()}
+        return arrays, int(self.header[STEP + slot]), int(self.header[SLOT_SEQ + slot])
+
+    def close(self):
+        # The NumPy views must go before the buffer can be released
+        self.header = None
+        self.slots = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def slot_capacity(n):
+    return max(2 * n, n + 64)
+
+
+def run_worker(init, commands, status):
+    """
+    Entry point of the physics process.
+
+    Args:
+        init: Dict of initial pos, vel, mass, rad and color arrays.
+        commands: Queue of Command objects, None stops the worker.
+        status: Queue the worker announces its shared blocks on, as
+            ("state", name, capacity) messages.
+    """
+    n = len(init["pos"])
+    bodies = Particles(n, trail_length=0)  # the trails are kept by the renderer
+    for i in range(n):
+        bodies.add(0, 0, init["rad"][i], init["mass"][i], color=init["color"][i])
+    bodies.pos[:] = init["pos"]
+    bodies.prev_pos[:] = init["pos"]
+    bodies.vel[:] = init["vel"]
+
+    sim = Simulation(bodies)
+    log = CommandLog() if COMMAND_LOG_PATH else None
+    scheduler = FixedStepScheduler(time_budget=1.0 / STEPS_PER_SECOND * MAX_SUBSTEPS)
+
+    shared = SharedState(slot_capacity(n))
+    shared.write(bodies, sim.step_count)
+    status.put(("state", shared.name, shared.capacity))
+
+    parent = parent_process()
+    running = True
+    last = time.perf_counter()
+    while running:
+        changed = False
+
+        if parent is not None and not parent.is_alive():
+            break
+
+        # Wait for a command, but never past the time the next step is due
+        wait = 0.1 if sim.paused else max(scheduler.step_interval - scheduler.accumulator, 0.0)
+        try:
+            command = commands.get(timeout=wait)
+            while True:
+                if command is None:
+                    running = False
+                    break
+                changed |= execute(sim, command, log)
+                command = commands.get(block=False)
+        except queue.Empty:
+            pass
+
+        now = time.perf_counter()
+        if sim.paused:
+            scheduler.reset()
+        else:
+            changed |= scheduler.run(now - last, sim.step) > 0
+        last = now
+
+        if len(bodies) > shared.capacity:
+            # Bodies were added past the capacity, move to a bigger block
+            old = shared
+            shared = SharedState(slot_capacity(len(bodies)))
+            status.put(("state", shared.name, shared.capacity))
+            old.close()
+            changed = True
+
+        if changed:
+            shared.write(bodies, sim.step_count)
+
+    if log is not None:
+        log.save(COMMAND_LOG_PATH)
+    shared.close()
+
+
+class WorkerView(Particles):
+    """
+    Read side of the published state, used by the renderer in place of the
+    Particles store.
+
+    pos, vel, mass, rad and color are views of the shared memory slot the
+    worker published last, only the trails and the border flashes live in
+    this process. The view is read only, changes go to the worker as
+    commands.
+    """
+
+    FIELDS = (
+        ("border_cnt", (), np.int32),
+        ("trail_count", (), np.int32),
+    )
+
+    def __init__(self, shared, trail_length=TRAIL_LENGHT):
+        super().__init__(16, trail_length)
+        self.shared = shared
+        self.seq = -1
+        self.step_count = 0
+        self.update()
+
+    def attach(self, shared):
+        """
+        Switches to a new shared block (after the worker outgrew the old one).
+        """
+        self.shared = shared
+        self.seq = -1
+        self.update()
+
+    def update(self):
+        """
+        Picks up the last published state and records it in the trails.
+
+        Returns:
+            bool: True if the worker published something new.
+        """
+        arrays, step, seq = self.shared.read()
+        if seq == self.seq:
+            return False
+        self.seq = seq
+
+        n = len(arrays["pos"])
+        if n != self.n or step < self.step_count:
+            # Bodies were added or removed, or an older checkpoint was
+            # loaded, the trails no longer line up
+            if n > self.capacity:
+                self._grow(max(n, 2 * self.capacity))
+            self.n = n
+            self._reslice()
+            self.trail_count[:] = 0
+            self.border_cnt[:] = 0
+        self.step_count = step
+
+        for field, _, _ in STATE_FIELDS:
+            setattr(self, field, arrays[field])
+        self.prev_pos = self.pos  # the worker runs on its own clock, no interpolation
+
+        box = periodic_box()
+        if box is not None and self.trail_length > 0:
+            self.follow_wraps(box)
+        self.push_trails()
+        return True
+
+    def follow_wraps(self, box):
+        """
+        Moves the trails of the bodies that wrapped around the periodic box
+        since the last update along with them, as Particles.wrap does in
+        the worker.
+        """
+        newest = self.trail[:, self.trail_head - 1 + self.trail_length]
+        jump = image_shift(self.pos - newest, box)
+        wrapped = np.flatnonzero(jump.any(axis=1) & (self.trail_count > 0))
+        self.shift_trails(wrapped, jump[wrapped])
+
+    def add(self, *args, **kwargs):
+        raise TypeError("WorkerView is read only, send an AddBody command")
+
+    def remove(self, index):
+        raise TypeError("WorkerView is read only, send a RemoveBody command")
+
+
+class PhysicsWorker:
+    """
+    Starts the physics process and connects the renderer to it.
+    """
+
+    def __init__(self, bodies, trail_length=TRAIL_LENGHT):
+        # spawn gives the worker a clean interpreter, without the pygame and
+        # Tk state of this process
+        ctx = get_context("spawn")
+        self.commands = ctx.Queue()
+        self.status = ctx.Queue()
+
+        init = {field: getattr(bodies, field).copy() for field, _, _ in STATE_FIELDS}
+        # Not a daemon, so the worker may start the process pool of the
+        # "parallel" force backend. It stops on its own if this process dies.
+        self.process = ctx.Process(target=run_worker, args=(init, self.commands, self.status))
+        self.process.start()
+
+        _, name, capacity = self.status.get(timeout=60)
+        self.shared = SharedState(capacity, name)
+        self.view = WorkerView(self.shared, trail_length)
+
+        # The interpreter waits for the worker on exit, make sure it is told
+        # to stop also when the main loop ends with an exception
+        self.stopped = False
+        atexit.register(self.stop)
+
+    def send(self, command):
+        self.commands.put(command)
+
+    def update(self):
+        """
+        Attaches to a new shared block if the worker announced one, and
+        refreshes the view.
+
+        Returns:
+            bool: True if the view changed.
+        """
+        if not self.process.is_alive():
+            raise RuntimeError("the physics worker stopped (exit code %s)" % self.process.exitcode)
+
+        announced = None
+        while True:
+            try:
+                announced = self.status.get(block=False)
+            except queue.Empty:
+                break
+
+        if announced is not None:
+            _, name, capacity = announced
+            old = self.shared
+            self.shared = SharedState(capacity, name)
+            self.view.attach(self.shared)
+            old.close()
+            return True
+
+        return self.view.update()
+
+    def stop(self, timeout=5.0):
+        if self.stopped:
+            return
+        self.stopped = True
+
+        self.commands.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        for field, _, _ in STATE_FIELDS:
+            setattr(self.view, field, None)
+        self.view.prev_pos = None
+        self.shared.close()
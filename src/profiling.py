@@ -0,0 +1,266 @@
+"""
+Instrumentation of the pygame loop: per phase frame timers, the HUD that
+shows them, CSV export and cProfile captures.
+
+The loop calls FrameTimer.lap after every phase (events, commands, forces,
+collisions, draw, ...), which charges the time since the previous lap to
+that phase, so a frame costs one perf_counter call per phase. While the
+timer is disabled lap returns right away. The last PROFILE_HISTORY frames
+are kept in ring buffers for the HUD and the CSV export.
+
+Hotkeys (see main.py): F2 shows the HUD, F3 writes the timings of the
+last frames to a CSV file, F4 profiles the next PROFILE_CAPTURE_FRAMES
+frames with cProfile. The Tk panel runs in its own thread, so it reports
+its CPU usage through thread_usage instead.
+"""
+import cProfile
+import csv
+import os
+import pstats
+
+import pygame
+
+from globals import *
+from text_cache import get_text_cache
+
+# CPU usage in percent of the threads that do not run the pygame loop, by
+# name, written by the threads themselves
+thread_usage = {}
+
+# Colors of the phases in the HUD graph, in the order they are first seen
+PHASE_COLORS = (
+    (90, 160, 255), (255, 170, 60), (240, 80, 80), (110, 220, 110),
+    (200, 120, 255), (255, 230, 90), (90, 220, 220), (160, 160, 160),
+)
+
+
+class FrameTimer:
+    """
+    Per phase wall clock time of every frame, kept for the last `history`
+    frames.
+    """
+
+    def __init__(self, history=PROFILE_HISTORY, enabled=PROFILE_HUD):
+        self.history = history
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.phases = {}  # name -> (history,) seconds, in the order first seen
+        self.totals = np.zeros(self.history)
+        self.step_counts = np.zeros(self.history, dtype=np.int64)
+        self.frames = 0  # frames recorded so far
+        self._current = {}
+        self._steps = 0
+        self._start = self._mark = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._start = self._mark = time.perf_counter()
+
+    def lap(self, phase):
+        """
+        Charges the time since the previous lap (or the frame start) to
+        `phase`. Several laps of the same phase in a frame add up.
+        """
+        if not self.enabled or self._mark is None:
+            return
+        now = time.perf_counter()
+        self._current[phase] = self._current.get(phase, 0.0) + now - self._mark
+        self._mark = now
+
+    def steps(self, count):
+        """
+        Records the physics steps run in this frame.
+        """
+        self._steps += count
+
+    def end_frame(self):
+        if not self.enabled or self._start is None:
+            return
+
+        slot = self.frames % self.history
+        for phase, seconds in self._current.items():
+            if phase not in self.phases:
+                self.phases[phase] = np.zeros(self.history)
+            self.phases[phase][slot] = seconds
+        for phase, ring in self.phases.items():
+            if phase not in self._current:
+                ring[slot] = 0.0
+
+        self.totals[slot] = time.perf_counter() - self._start
+        self.step_counts[slot] = self._steps
+        self.frames += 1
+        self._current = {}
+        self._steps = 0
+        self._start = self._mark = None
+
+    def recorded(self):
+        """
+        Returns the slot indices of the recorded frames, oldest first.
+        """
+        count = min(self.frames, self.history)
+        return (np.arange(self.frames - count, self.frames)) % self.history
+
+    def stats(self):
+        """
+        Summary of the recorded frames.
+
+        Returns:
+            dict: "frame" and every phase map to (mean, p95, max) in
+            milliseconds, "steps_per_second" to the physics rate.
+        """
+        slots = self.recorded()
+        if len(slots) == 0:
+            return {"frame": (0.0, 0.0, 0.0), "steps_per_second": 0.0}
+
+        def summary(seconds):
+            ms = seconds[slots] * 1000
+            return float(ms.mean()), float(np.percentile(ms, 95)), float(ms.max())
+
+        result = {"frame": summary(self.totals)}
+        for phase, ring in self.phases.items():
+            result[phase] = summary(ring)
+
+        elapsed = self.totals[slots].sum()
+        result["steps_per_second"] = float(self.step_counts[slots].sum() / elapsed) if elapsed > 0 else 0.0
+        return result
+
+    def save_csv(self, path):
+        """
+        Writes one row per recorded frame, oldest first, with the time of
+        every phase in milliseconds.
+        """
+        slots = self.recorded()
+        phases = list(self.phases)
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "total_ms", "steps"] + [p + "_ms" for p in phases])
+            first = self.frames - len(slots)
+            for k, slot in enumerate(slots):
+                row = [first + k, round(self.totals[slot] * 1000, 4), int(self.step_counts[slot])]
+                row += [round(self.phases[p][slot] * 1000, 4) for p in phases]
+                writer.writerow(row)
+
+
+class ProfileCapture:
+    """
+    Runs cProfile over a given number of frames and writes the stats to a
+    file (readable with pstats or snakeviz). Only the pygame thread is
+    profiled.
+    """
+
+    def __init__(self):
+        self.profile = None
+        self.frames_left = 0
+        self.path = None
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self, frames=PROFILE_CAPTURE_FRAMES, path=None):
+        if self.active:
+            return
+        self.path = path or os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+        self.frames_left = frames
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        print("Profiling the next", frames, "frames")
+
+    def frame_done(self):
+        """
+        Call once per frame, stops the capture after the last frame.
+        """
+        if self.profile is None:
+            return
+        self.frames_left -= 1
+        if self.frames_left > 0:
+            return
+
+        self.profile.disable()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.profile.dump_stats(self.path)
+        print("Profile written to", self.path)
+        pstats.Stats(self.profile).sort_stats("cumulative").print_stats(15)
+        self.profile = None
+
+
+class FrameHud:
+    """
+    Overlay with the frame time breakdown, the physics rate and a graph of
+    the last frames, one stacked bar per frame.
+
+    The text and the graph are redrawn PROFILE_HUD_HZ times per second only,
+    every other frame just blits them.
+    """
+
+    GRAPH_SIZE = (240, 60)
+    # Frame time at the top of the graph
+    GRAPH_MS = 50.0
+
+    def __init__(self, timer, refresh_hz=PROFILE_HUD_HZ):
+        self.timer = timer
+        self.refresh_interval = 1.0 / refresh_hz
+        self.last_refresh = -float("inf")
+        self.lines = []
+        self.graph = pygame.Surface(self.GRAPH_SIZE)
+        self.graph.set_alpha(200)
+
+    def refresh(self, extra=()):
+        stats = self.timer.stats()
+        mean, p95, worst = stats.pop("frame")
+        steps_per_second = stats.pop("steps_per_second")
+        fps = 1000 / mean if mean > 0 else 0.0
+
+        text = [
+            f"frame {mean:5.1f} ms  p95 {p95:5.1f}  max {worst:5.1f}  {fps:5.1f} fps",
+            f"physics {steps_per_second:6.1f} steps/s",
+        ]
+        for (phase, (mean, p95, worst)), color in zip(stats.items(), PHASE_COLORS):
+            text.append((f"{phase:10} {mean:6.2f} ms  p95 {p95:6.2f}  max {worst:6.2f}", color))
+        for name, usage in thread_usage.items():
+            text.append(f"{name} thread CPU {usage:5.1f}%")
+        text.extend(extra)
+
+        cache = get_text_cache()
+        self.lines = [
+            cache.render(line, WHITE, 18) if isinstance(line, str) else cache.render(line[0], line[1], 18)
+            for line in text
+        ]
+        self.draw_graph()
+
+    def draw_graph(self):
+        width, height = self.GRAPH_SIZE
+        self.graph.fill(BLACK)
+        slots = self.timer.recorded()[-width:]
+        scale = height / (self.GRAPH_MS / 1000)
+
+        for x, slot in enumerate(slots, start=width - len(slots)):
+            y = height
+            for ring, color in zip(self.timer.phases.values(), PHASE_COLORS):
+                bar = ring[slot] * scale
+                if bar >= 0.5:
+                    pygame.draw.line(self.graph, color, (x, y), (x, max(y - bar, 0)))
+                y -= bar
+
+        # 60 fps line
+        y = height - scale / 60
+        pygame.draw.line(self.graph, (90, 90, 90), (0, y), (width, y))
+
+    def draw(self, screen, extra=()):
+        """
+        Draws the HUD in the top left corner of the screen.
+
+        Args:
+            extra: More text lines to show under the timings.
+        """
+        now = time.perf_counter()
+        if now - self.last_refresh >= self.refresh_interval:
+            self.last_refresh = now
+            self.refresh(extra)
+
+        y = 5
+        screen.blits([(line, (5, y + 18 * k)) for k, line in enumerate(self.lines)], doreturn=False)
+        screen.blit(self.graph, (5, y + 18 * len(self.lines) + 4))
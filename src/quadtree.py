@@ -0,0 +1,305 @@
+from globals import *
+from boundaries import minimum_image
+
+
+def spread_bits(v):
+    """
+    Spreads the lower 16 bits of each integer so that there is a zero bit
+    between every two of them (used to build Morton keys).
+    """
+    v = v & 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    v = (v | (v << 1)) & 0x55555555
+    return v
+
+
+class QuadTree:
+    """
+    Barnes-Hut quadtree built from the body positions.
+
+    The bodies are sorted along a Morton (Z-order) curve, so every node of the
+    tree owns a contiguous range of the sorted bodies. The tree is stored as
+    flat arrays (one entry per node) and the force walk is done for a whole
+    block of bodies at once: every step of the walk handles all the
+    (body, node) pairs that are still open.
+    """
+
+    MAX_DEPTH = 16
+
+    def __init__(self, pos, mass, leaf_size=BH_LEAF_SIZE):
+        self.n = len(pos)
+        self.leaf_size = max(1, leaf_size)
+
+        depth = self.MAX_DEPTH
+        lo = pos.min(axis=0) if self.n else np.zeros(2)
+        size = float(np.ptp(pos, axis=0).max()) if self.n else 0.0
+        if size <= 0:
+            size = 1.0
+        size *= 1 + 1e-9  # keep the farthest body inside the root cell
+
+        cells = ((pos - lo) / size * (1 << depth)).astype(np.int64)
+        np.clip(cells, 0, (1 << depth) - 1, out=cells)
+        keys = (spread_bits(cells[:, 0]) << 1) | spread_bits(cells[:, 1])
+
+        self.order = np.argsort(keys, kind="stable")
+        self.rank = np.empty(self.n, dtype=np.int64)
+        self.rank[self.order] = np.arange(self.n)
+        keys = keys[self.order]
+        self.pos = pos[self.order]
+        self.mass = mass[self.order]
+
+        # Prefix sums give the mass and center of mass of any node in O(1)
+        cm = np.concatenate(([0.0], np.cumsum(self.mass)))
+        cmx = np.concatenate(([0.0], np.cumsum(self.mass * self.pos[:, 0])))
+        cmy = np.concatenate(([0.0], np.cumsum(self.mass * self.pos[:, 1])))
+
+        start = [np.array([0])]
+        end = [np.array([self.n])]
+        level = [np.array([0])]
+        prefix = [np.array([0], dtype=np.int64)]
+        origin = [lo[None, :].copy()]
+        children = [np.full((1, 4), -1, dtype=np.int64)]
+
+        node_count = 1
+        frontier = np.array([0])
+        frontier_level = 0
+
+        while len(frontier) and frontier_level < depth:
+            lvl = frontier_level
+            f_start = np.concatenate(start)[frontier]
+            f_end = np.concatenate(end)[frontier]
+            f_prefix = np.concatenate(prefix)[frontier]
+            f_origin = np.concatenate(origin)[frontier]
+
+            split = (f_end - f_start) > self.leaf_size
+            if not split.any():
+                break
+
+            parents = frontier[split]
+            p_prefix = f_prefix[split]
+            p_origin = f_origin[split]
+
+            shift = 2 * (depth - lvl - 1)
+            sub = keys >> shift
+            c_prefix = (p_prefix[:, None] * 4 + np.arange(4)[None, :]).ravel()
+            c_start = np.searchsorted(sub, c_prefix, side="left")
+            c_end = np.searchsorted(sub, c_prefix, side="right")
+
+            # Quadrant q holds the x bit in its high bit and the y bit in its low bit
+            half = size / (1 << (lvl + 1))
+            q = np.tile(np.arange(4), len(parents))
+            c_origin = np.repeat(p_origin, 4, axis=0)
+            c_origin[:, 0] += ((q >> 1) & 1) * half
+            c_origin[:, 1] += (q & 1) * half
+
+            used = c_end > c_start
+            ids = np.full(len(c_prefix), -1, dtype=np.int64)
+            ids[used] = node_count + np.arange(used.sum())
+            node_count += int(used.sum())
+
+            all_children = np.concatenate(children)
+            all_children[parents] = ids.reshape(-1, 4)
+            children = [all_children, np.full((int(used.sum()), 4), -1, dtype=np.int64)]
+
+            start.append(c_start[used])
+            end.append(c_end[used])
+            level.append(np.full(int(used.sum()), lvl + 1))
+            prefix.append(c_prefix[used])
+            origin.append(c_origin[used])
+
+            frontier = ids[used]
+            frontier_level = lvl + 1
+
+        self.start = np.concatenate(start)
+        self.end = np.concatenate(end)
+        self.level = np.concatenate(level)
+        self.origin = np.concatenate(origin)
+        self.children = np.concatenate(children)
+        self.width = size / (1 << self.level)
+        self.is_leaf = (self.children < 0).all(axis=1)
+
+        self.node_mass = cm[self.end] - cm[self.start]
+        safe = np.where(self.node_mass > 0, self.node_mass, 1.0)
+        self.com = np.empty((len(self.start), 2))
+        self.com[:, 0] = (cmx[self.end] - cmx[self.start]) / safe
+        self.com[:, 1] = (cmy[self.end] - cmy[self.start]) / safe
+
+        # Massless nodes fall back to the cell center
+        empty = self.node_mass <= 0
+        self.com[empty] = self.origin[empty] + self.width[empty, None] / 2
+
+    def __len__(self):
+        return len(self.start)
+
+    def accelerations(self, targets=None, theta=BH_THETA, softening=GRAVITY_SOFTENING, gravitational_constant=G, chunk=4096,
+                      box=None):
+        """
+        Computes the gravitational acceleration on the given bodies by walking
+        the tree: a node is replaced by its total mass at its center of mass
+        when width / distance < theta, otherwise it is opened.
+
+        Args:
+            targets (np.ndarray): Indices (in the original body order) of the
+                bodies to compute the acceleration for (default: all of them).
+            theta (float): Opening angle, 0 gives back the direct sum.
+            softening (float): Plummer softening length.
+            gravitational_constant (float): Gravitational constant (G).
+            chunk (int): Number of target bodies walked at the same time.
+            box (tuple): (width, height) of the periodic box. The nodes are
+                then seen through their nearest image, and only approximated
+                when the whole node is within half a box of the body, so
+                every body inside it has that same nearest image.
+
+        Returns:
+            np.ndarray: (len(targets), 2) accelerations.
+        """
+        if targets is None:
+            targets = np.arange(self.n)
+        targets = np.asarray(targets)
+
+        acc = np.zeros((len(targets), 2))
+        if self.n == 0:
+            return acc
+
+        eps2 = softening ** 2
+        theta2 = theta ** 2
+
+        for s in range(0, len(targets), chunk):
+            t_rank = self.rank[targets[s:s + chunk]]
+            tpos = self.pos[t_rank]
+            nt = len(t_rank)
+            ax = np.zeros(nt)
+            ay = np.zeros(nt)
+
+            pair_t = np.arange(nt)
+            pair_n = np.zeros(nt, dtype=np.int64)
+
+            while len(pair_t):
+                dx = self.com[pair_n, 0] - tpos[pair_t, 0]
+                dy = self.com[pair_n, 1] - tpos[pair_t, 1]
+                w = self.width[pair_n]
+
+                # Never approximate a node that contains the body itself
+                ox = tpos[pair_t, 0] - self.origin[pair_n, 0]
+                oy = tpos[pair_t, 1] - self.origin[pair_n, 1]
+                inside = (ox >= 0) & (ox < w) & (oy >= 0) & (oy < w)
+
+                if box is not None:
+                    # The node cell, moved like its center of mass, must lie
+                    # within half a box of the body
+                    sx = minimum_image(dx.copy(), box[0]) - dx
+                    sy = minimum_image(dy.copy(), box[1]) - dy
+                    dx += sx
+                    dy += sy
+                    fits = (
+                        (abs(sx - ox + w / 2) + w / 2 <= box[0] / 2)
+                        & (abs(sy - oy + w / 2) + w / 2 <= box[1] / 2)
+                    )
+                r2 = dx * dx + dy * dy
+
+                far = (w * w < theta2 * r2) & ~inside
+                if box is not None:
+                    far &= fits
+
+                if far.any():
+                    r2f = r2[far] + eps2
+                    f = self.node_mass[pair_n[far]] / (r2f * np.sqrt(r2f))
+                    ax += np.bincount(pair_t[far], weights=f * dx[far], minlength=nt)
+                    ay += np.bincount(pair_t[far], weights=f * dy[far], minlength=nt)
+
+                near = ~far
+                leaf = near & self.is_leaf[pair_n]
+                if leaf.any():
+                    self._leaf_sum(pair_t[leaf], pair_n[leaf], tpos, t_rank, eps2, ax, ay, box)
+
+                inner = near & ~self.is_leaf[pair_n]
+                ch = self.children[pair_n[inner]]
+                valid = ch >= 0
+                pair_t = np.repeat(pair_t[inner], valid.sum(axis=1))
+                pair_n = ch[valid]
+
+            acc[s:s + chunk, 0] = ax
+            acc[s:s + chunk, 1] = ay
+
+        acc *= gravitational_constant
+        return acc
+
+    def _leaf_sum(self, pair_t, pair_n, tpos, t_rank, eps2, ax, ay, box=None):
+        # Direct sum between the targets and every body stored in the opened leaves
+        counts = self.end[pair_n] - self.start[pair_n]
+        rep_t = np.repeat(pair_t, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = np.repeat(self.start[pair_n], counts) + offsets
+
+        dx = self.pos[j, 0] - tpos[rep_t, 0]
+        dy = self.pos[j, 1] - tpos[rep_t, 1]
+        if box is not None:
+            minimum_image(dx, box[0])
+            minimum_image(dy, box[1])
+        d2 = dx * dx + dy * dy
+
+        # Skip the body itself and coincident bodies, like the direct solver
+        keep = (j != t_rank[rep_t]) & (d2 >= 1e-20)
+        r2 = d2[keep] + eps2
+        f = self.mass[j[keep]] / (r2 * np.sqrt(r2))
+        ax += np.bincount(rep_t[keep], weights=f * dx[keep], minlength=len(ax))
+        ay += np.bincount(rep_t[keep], weights=f * dy[keep], minlength=len(ay))
+
+
+def barnes_hut_accelerations(pos, mass, targets=None, theta=BH_THETA, leaf_size=BH_LEAF_SIZE, softening=GRAVITY_SOFTENING, gravitational_constant=G,
+                             box=None):
+    """
+    Builds a fresh quadtree from the positions and returns the Barnes-Hut
+    accelerations of the target bodies (all of them by default), through
+    the nearest images when `box` is given.
+    """
+    tree = QuadTree(pos, mass, leaf_size)
+    return tree.accelerations(targets, theta, softening, gravitational_constant, box=box)
+
+
+def accuracy_report(n=5000, thetas=(0.3, 0.5, 0.7, 1.0), leaf_size=BH_LEAF_SIZE, softening=GRAVITY_SOFTENING, seed=0):
+    """
+    Compares the Barnes-Hut accelerations against the direct solver on a
+    clustered random system and prints the relative error and the timing for
+    each opening angle, to pick theta for a given error budget.
+    """
+    from gravity import direct_accelerations
+
+    rng = np.random.default_rng(seed)
+    # Two clumps plus a uniform background, closer to what we simulate than a flat distribution
+    pos = np.concatenate([
+        rng.normal((250, 300), 60, (n // 3, 2)),
+        rng.normal((550, 300), 40, (n // 3, 2)),
+        rng.uniform(0, (screen_width, screen_height), (n - 2 * (n // 3), 2)),
+    ])
+    mass = rng.uniform(MIN_MASS, MAX_MASS, n)
+
+    t = time.perf_counter()
+    ref = direct_accelerations(pos, mass, softening=softening)
+    t_direct = time.perf_counter() - t
+    ref_norm = np.linalg.norm(ref, axis=1)
+
+    print(f"N = {n}, leaf size = {leaf_size}, softening = {softening}")
+    print(f"direct       {t_direct * 1000:9.1f} ms")
+    print("theta     build ms    walk ms   median err    99% err    max err")
+
+    for theta in thetas:
+        t = time.perf_counter()
+        tree = QuadTree(pos, mass, leaf_size)
+        t_build = time.perf_counter() - t
+
+        t = time.perf_counter()
+        acc = tree.accelerations(theta=theta, softening=softening)
+        t_walk = time.perf_counter() - t
+
+        err = np.linalg.norm(acc - ref, axis=1) / np.where(ref_norm > 0, ref_norm, 1.0)
+        print(
+            f"{theta:5.2f} {t_build * 1000:11.1f} {t_walk * 1000:10.1f}"
+            f" {np.median(err):12.2e} {np.percentile(err, 99):10.2e} {err.max():10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    accuracy_report()
@@ -0,0 +1,443 @@
+import pygame
+
+from globals import *
+from body import *
+from text_cache import *
+
+_screen = None
+
+
+def get_screen():
+    """
+    Returns the display surface, initializing pygame and opening the window
+    the first time it is called.
+    """
+    global _screen
+
+    if _screen is None:
+        pygame.init()
+        _screen = pygame.display.set_mode((screen_width, screen_height))
+    return _screen
+
+
+class CircleHandle:
+    def __init__(self):
+        pass  # No attributes initialized here
+
+    def draw(self, surface, center, radius, handle_offset, handle_radius, handle_color, line_color, line_thickness):
+        self.center = center
+        self.radius = radius
+        self.handle_offset = handle_offset  # Distance of handle from center
+        self.handle_radius = handle_radius
+        self.handle_color = handle_color
+        self.line_color = line_color
+        self.line_thickness = line_thickness
+
+        # Calculate handle position based on offset and direction (optional)
+        handle_direction = (1, 0)  # Adjust for desired direction (e.g., up: (0, -1))
+        handle_pos = (
+            self.center[0] + handle_direction[0] * (self.radius + self.handle_offset),
+            self.center[1] + handle_direction[1] * (self.radius + self.handle_offset)
+        )
+
+        # Draw handle circle and connecting line
+        pygame.draw.circle(surface, handle_color, handle_pos, handle_radius)
+        pygame.draw.line(
+            surface, line_color, self.center, handle_pos, line_thickness
+        )
+
+    def is_clicked(self, mouse_pos):
+        # Check collision with handle circle (consider handle_radius)
+        handle_pos = (
+            self.center[0] + self.handle_direction[0] * (self.radius + self.handle_offset),
+            self.center[1] + self.handle_direction[1] * (self.radius + self.handle_offset)
+        )
+        distance = ((mouse_pos[0] - handle_pos[0])**2 + (mouse_pos[1] - handle_pos[1])**2)**0.5
+        return distance <= self.handle_radius
+
+
+def draw_axes(screen, width, height, offset, color=(0, 0, 0), tick_size=20, label_distance=15):
+    """
+    Draws X and Y axes with tickmarks, numbers, and arrows on the Pygame screen.
+
+    Args:
+        screen: The Pygame screen surface.
+        width: The width of the screen.
+        height: The height of the screen.
+        color: The color of the axes (default black).
+        tick_size: The size of the tick marks (default 10 pixels).
+        label_distance: The distance between the axis and the labels (default 5 pixels).
+    """
+    # Draw X-axis
+    #print("Height",  height // 2)
+    pygame.draw.line(screen, color,
+                     (0, int((height // 2)+offset[1])),
+                     (width,int((height // 2)+offset[1])),
+                    2)
+
+    # Draw Y-axis
+    pygame.draw.line(screen, color,
+                     ( int((width // 2)+offset[0]), 0),
+                     (int((width // 2)+offset[0]), height),
+                    2)
+
+    tickmarks = False
+    # Draw tick marks and labels on X-axis
+    for i in range(1, width // tick_size + 1):
+        if(not tickmarks):
+            break 
+        
+        x = i * tick_size
+        pygame.draw.line(
+            screen,
+            color,
+            (x, height // 2 - tick_size // 2),
+            (x, height // 2 + tick_size // 2),
+            1,
+        )
+        
+        # Draw label (avoid drawing at the end)
+        if i != width // tick_size:
+            label_surface = get_text_cache().render(str(i * tick_size), color, 15)
+            screen.blit(
+                label_surface,
+                (x - label_surface.get_width() // 2, height // 2 + label_distance),
+            )
+
+    # Draw tick marks and labels on Y-axis
+    for i in range(1, height // tick_size + 1):
+        if(not tickmarks):
+            break
+
+        y = i * tick_size
+        pygame.draw.line(
+            screen,
+            color,
+            (width // 2 - tick_size // 2, y),
+            (width // 2 + tick_size // 2, y),
+            1,
+        )
+        # Draw label (avoid drawing at the end)
+        if i != height // tick_size:
+            label_surface = get_text_cache().render(str(i * tick_size), color, 15)
+            screen.blit(
+                label_surface,
+                (
+                    width // 2 - label_surface.get_width() - label_distance,
+                    y - label_surface.get_height() // 2,
+                ),
+            )
+
+    # Draw arrows at the end of axes
+    arrow_size = 10
+    pygame.draw.polygon(
+        screen,
+        color,
+        [
+            (width - arrow_size, height // 2 - arrow_size // 2),
+            (width, height // 2),
+            (width - arrow_size, height // 2 + arrow_size // 2),
+        ],
+        2,
+    )
+
+
+def to_screen(points, off, zoom):
+    """
+    Maps world coordinates to screen pixels: the view is panned by `off` and
+    then zoomed around the center of the screen.
+
+    Args:
+        points: (..., 2) array of world coordinates.
+        off: (x, y) pan offset, in world units.
+        zoom: Zoom factor.
+
+    Returns:
+        np.ndarray: The screen coordinates, same shape as points.
+    """
+    center = np.array((screen_width / 2, screen_height / 2))
+    return (np.asarray(points, dtype=np.float64) + off - center) * zoom + center
+
+
+def to_world(point, off, zoom):
+    """
+    Inverse of to_screen, for a single (x, y) screen point.
+    """
+    cx = screen_width / 2
+    cy = screen_height / 2
+    return (point[0] - cx) / zoom + cx - off[0], (point[1] - cy) / zoom + cy - off[1]
+
+
+def viewport(off, zoom, margin=0.0):
+    """
+    Returns the (xmin, ymin, xmax, ymax) world rectangle shown on screen,
+    grown by `margin` pixels on every side.
+    """
+    x0, y0 = to_world((-margin, -margin), off, zoom)
+    x1, y1 = to_world((screen_width + margin, screen_height + margin), off, zoom)
+    return x0, y0, x1, y1
+
+
+def visible_trails(b, off, zoom):
+    """
+    Returns the indices of the bodies whose trail can cross the screen.
+
+    The test uses the bounding box of the whole trail buffer of each body,
+    stale points included, so it can keep a hidden trail but never drops a
+    visible one.
+    """
+    if b.trail_length < 2 or len(b) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    x0, y0, x1, y1 = viewport(off, zoom, margin=1.0)
+    # Every point is stored in both halves, the first one is enough. The
+    # coordinates are reduced one at a time, a reduction over the pairs is
+    # many times slower.
+    x = b.trail[:, :b.trail_length, 0]
+    y = b.trail[:, :b.trail_length, 1]
+    hit = (x.max(axis=1) >= x0) & (x.min(axis=1) <= x1) & (y.max(axis=1) >= y0) & (y.min(axis=1) <= y1)
+    return np.flatnonzero(hit & (b.trail_count > 1))
+
+
+def map_colors(screen, colors):
+    """
+    Converts (N, 3) RGB colors to the pixel values of the screen format.
+    """
+    return np.array([screen.map_rgb(c) for c in np.asarray(colors).tolist()], dtype=np.uint32)
+
+
+def draw_trails(screen, b, off, zoom, bodies=None):
+    """
+    Draws the trails of the bodies in one batch.
+
+    The view transform is applied once to the trail buffers, every trail
+    segment is rasterized into pixels with array operations, and the pixels
+    are written straight into the screen through surfarray, instead of one
+    pygame.draw call per segment.
+
+    Args:
+        bodies: Indices of the bodies to draw, all of them by default.
+    """
+    length = b.trail_length
+    if bodies is None:
+        bodies = np.arange(len(b))
+    if length < 2 or len(bodies) == 0:
+        return
+
+    # Every trail ends at the shared head, the valid points are its last trail_count
+    head = b.trail_head
+    trails = b.trail[:, head:head + length]
+    if len(bodies) < len(b):
+        trails = trails[bodies]
+    center = np.array((screen_width / 2, screen_height / 2), dtype=np.float32)
+    points = trails + np.asarray(off, dtype=np.float32) - center
+    points *= np.float32(zoom)
+    points += center
+
+    d = points[:, 1:] - points[:, :-1]
+    valid = np.arange(length - 1)[None, :] >= (length - b.trail_count[bodies])[:, None]
+
+    # Enough samples per segment to leave no gaps, capped for very long jumps
+    samples = np.ceil(np.maximum(np.abs(d[..., 0]), np.abs(d[..., 1]))).astype(np.int64)
+    np.clip(samples, 1, screen_width + screen_height, out=samples)
+    samples[~valid] = 0
+
+    samples = samples.ravel()
+    seg = np.repeat(np.arange(len(samples)), samples)
+    if len(seg) == 0:
+        return
+
+    p0 = points[:, :-1].reshape(-1, 2)[seg]
+    if len(seg) > samples.size - (samples == 0).sum():
+        # Some segments are longer than a pixel, fill them in
+        t = (np.arange(len(seg)) - np.repeat(np.cumsum(samples) - samples, samples)) / samples[seg]
+        p0 += d.reshape(-1, 2)[seg] * t[:, None].astype(np.float32)
+    xs = np.rint(p0[:, 0]).astype(np.int64)
+    ys = np.rint(p0[:, 1]).astype(np.int64)
+    body = seg // (length - 1)
+
+    width, height = screen.get_size()
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+    colors = map_colors(screen, b.color[bodies])
+    pixels = pygame.surfarray.pixels2d(screen)
+    pixels[xs[inside], ys[inside]] = colors[body[inside]]
+    del pixels  # unlock the surface
+
+
+def draw_points(screen, centers, colors):
+    """
+    Draws bodies too small to show as circles as single pixels, all at once.
+    Bodies falling on the same pixel just overwrite each other.
+    """
+    if len(centers) == 0:
+        return
+
+    xs = centers[:, 0].astype(np.int64)
+    ys = centers[:, 1].astype(np.int64)
+    width, height = screen.get_size()
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+    pixels = pygame.surfarray.pixels2d(screen)
+    pixels[xs[inside], ys[inside]] = map_colors(screen, colors)[inside]
+    del pixels
+
+
+def draw_labels(screen, b, centers, shown):
+    """
+    Writes the velocity label next to the bodies in `shown`.
+
+    The label surfaces come from the shared text cache and are drawn with a
+    single blits call.
+
+    Args:
+        centers: (N, 2) screen positions of the bodies in `shown`.
+        shown: Indices of the bodies to label.
+    """
+    if len(shown) == 0:
+        return
+
+    cache = get_text_cache()
+    velocities = b.vel[shown].tolist()
+    blits = []
+    for center, (vx, vy) in zip(centers.tolist(), velocities):
+        blits.append((cache.render(f"vx{vx:.1f} vy{vy:.1f}", RED), center))
+
+    screen.blits(blits, doreturn=False)
+
+
+def draw_bodies(b, off, zoom, alpha=1.0, screen=None):
+    """
+    Draws every body of the store with its trail and velocity label.
+
+    Only what can be seen costs anything: bodies outside the viewport are
+    culled on the particle arrays, bodies smaller than a pixel are drawn as
+    single pixels, and trails and labels are skipped below their zoom
+    thresholds.
+
+    Args:
+        b: The Particles store.
+        off: (x, y) pan offset.
+        zoom: Zoom factor.
+        alpha: Fraction of a step elapsed since the last physics step, used
+            to interpolate the positions.
+        screen: Surface to draw on, the display by default.
+    """
+    if screen is None:
+        screen = get_screen()
+
+    centers = to_screen(b.render_pos(alpha), off, zoom)
+    radii = b.rad * zoom
+
+    on_screen = (
+        (centers[:, 0] + radii >= 0) & (centers[:, 0] - radii < screen_width)
+        & (centers[:, 1] + radii >= 0) & (centers[:, 1] - radii < screen_height)
+    )
+    small = radii < POINT_RADIUS
+    points = np.flatnonzero(on_screen & small)
+    circles = np.flatnonzero(on_screen & ~small)
+
+    # The trails go below the bodies, so the part inside the circles is hidden
+    if zoom >= TRAIL_MIN_ZOOM:
+        draw_trails(screen, b, off, zoom, visible_trails(b, off, zoom))
+
+    draw_points(screen, centers[points], b.color[points])
+
+    colors = b.color[circles].tolist()
+    for center, radius, color in zip(centers[circles].tolist(), radii[circles].tolist(), colors):
+        pygame.draw.circle(screen, color, center, radius)
+
+    if LABELS_ENABLED and zoom >= LABEL_MIN_ZOOM:
+        shown = circles[radii[circles] >= LABEL_MIN_RADIUS]
+        draw_labels(screen, b, centers[shown], shown)
+
+    np.subtract(b.border_cnt, 1, out=b.border_cnt, where=b.border_cnt > 0)
+
+
+# Color stops of the density colormap, from empty to the densest pixel
+DENSITY_STOPS = (
+    (0.0, (0, 0, 0)),
+    (0.25, (60, 10, 110)),
+    (0.5, (190, 40, 80)),
+    (0.75, (250, 150, 30)),
+    (1.0, (255, 255, 220)),
+)
+
+
+def density_palette(stops=DENSITY_STOPS, size=256):
+    """
+    Returns a (size, 3) uint8 lookup table interpolating the color stops.
+    """
+    x = np.linspace(0.0, 1.0, size)
+    at = [s for s, _ in stops]
+    rgb = np.array([c for _, c in stops], dtype=np.float64)
+    return np.stack([np.interp(x, at, rgb[:, k]) for k in range(3)], axis=1).astype(np.uint8)
+
+
+class DensityMap:
+    """
+    Draws the bodies as a density heatmap instead of one circle each.
+
+    Every frame the screen positions are binned into a screen-sized 2D
+    histogram with np.bincount, optionally blended with the previous frames
+    for a motion blur and log scaled. The result is written as palette
+    indices into an 8-bit surface whose palette is the colormap, so the
+    colors are looked up by the blit that puts it on the display. The cost
+    grows with N only through the binning.
+    """
+
+    def __init__(self, weight=DENSITY_WEIGHT, decay=DENSITY_DECAY):
+        """
+        Args:
+            weight: "mass" to weight every body by its mass, "count" to count
+                the bodies.
+            decay: Fraction of the previous frames kept in the map, 0 shows
+                only the current frame.
+        """
+        self.weight = weight
+        self.decay = decay
+        self.palette = density_palette()
+        self.density = np.zeros((screen_width, screen_height), dtype=np.float64)
+        self.surface = None
+
+    def reset(self):
+        self.density[:] = 0
+
+    def accumulate(self, b, off, zoom, alpha=1.0):
+        """
+        Bins the bodies into the density map.
+        """
+        width, height = self.density.shape
+        centers = to_screen(b.render_pos(alpha), off, zoom)
+        xs = centers[:, 0].astype(np.int64)
+        ys = centers[:, 1].astype(np.int64)
+        inside = (centers[:, 0] >= 0) & (xs < width) & (centers[:, 1] >= 0) & (ys < height)
+
+        weights = b.mass[inside] if self.weight == "mass" else None
+        hist = np.bincount(xs[inside] * height + ys[inside], weights=weights, minlength=width * height)
+
+        if self.decay > 0:
+            self.density *= self.decay
+            self.density += hist.reshape(width, height)
+        else:
+            self.density = hist.reshape(width, height).astype(np.float64)
+
+    def indices(self):
+        """
+        Returns the (width, height) uint8 palette indices of the current map.
+        """
+        scaled = np.log1p(self.density, dtype=np.float32)
+        top = scaled.max()
+        if top > 0:
+            scaled *= (len(self.palette) - 1) / top
+        return scaled.astype(np.uint8)
+
+    def draw(self, b, off, zoom, alpha=1.0):
+        screen = get_screen()
+        if self.surface is None:
+            self.surface = pygame.Surface(self.density.shape, depth=8)
+            self.surface.set_palette([tuple(c) for c in self.palette.tolist()])
+
+        self.accumulate(b, off, zoom, alpha)
+        pygame.surfarray.blit_array(self.surface, self.indices())
+        screen.blit(self.surface, (0, 0))
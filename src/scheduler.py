@@ -0,0 +1,94 @@
+from globals import *
+
+
+class FixedStepScheduler:
+    """
+    Fixed timestep accumulator that decouples the physics clock from the
+    rendering rate.
+
+    Every frame the elapsed wall clock time is added to an accumulator and
+    the physics runs one TIMESTEP for each step interval the accumulator
+    holds. The leftover fraction of a step is used by the renderer to
+    interpolate between the previous and the current state.
+    """
+
+    def __init__(self, steps_per_second=STEPS_PER_SECOND, max_substeps=MAX_SUBSTEPS, time_budget=PHYSICS_TIME_BUDGET):
+        """
+        Args:
+            steps_per_second: Physics steps to run per second of wall clock time.
+            max_substeps: Most steps run in a single frame, the backlog above
+                it is dropped so a slow frame cannot snowball (spiral of death).
+            time_budget: Wall clock seconds the physics may use per frame.
+        """
+        self.step_interval = 1.0 / steps_per_second
+        self.max_substeps = max_substeps
+        self.time_budget = time_budget
+        self.accumulator = 0.0
+        self.dropped = 0  # steps skipped by the guards, for diagnostics
+
+    def reset(self):
+        self.accumulator = 0.0
+
+    def advance(self, frame_time):
+        """
+        Adds the time elapsed since the last frame and returns the number of
+        physics steps due this frame.
+        """
+        self.accumulator += frame_time
+        due = int(self.accumulator / self.step_interval)
+
+        if due > self.max_substeps:
+            self.drop(due - self.max_substeps)
+            due = self.max_substeps
+
+        return due
+
+    def consume(self):
+        """
+        Marks one physics step as done.
+        """
+        self.accumulator -= self.step_interval
+
+    def drop(self, steps):
+        self.dropped += steps
+        self.accumulator -= steps * self.step_interval
+
+    def drop_backlog(self):
+        """
+        Discards every whole step still due (used when the time budget ran out).
+        """
+        self.drop(int(self.accumulator / self.step_interval))
+
+    def run(self, frame_time, step):
+        """
+        Runs the physics steps due this frame, stopping early when the time
+        budget is used up.
+
+        Args:
+            frame_time: Wall clock seconds since the previous frame.
+            step: Callable running one physics step.
+
+        Returns:
+            The number of steps run.
+        """
+        due = self.advance(frame_time)
+        deadline = time.perf_counter() + self.time_budget
+
+        done = 0
+        while done < due:
+            step()
+            self.consume()
+            done += 1
+
+            if time.perf_counter() > deadline:
+                self.drop_backlog()
+                break
+
+        return done
+
+    @property
+    def alpha(self):
+        """
+        Fraction of a step elapsed since the last physics step, between 0 and 1.
+        """
+        return min(max(self.accumulator / self.step_interval, 0.0), 1.0)
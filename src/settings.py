@@ -1,7 +1,11 @@
+import tkinter as tk
+
 from globals import *
+from commands import *
+from profiling import thread_usage
 import traceback
 
-def settings_window(shared_list):
+def settings_window(publisher):
     global b
     
     control_window = tk.Tk()
@@ -17,17 +21,29 @@ def settings_window(shared_list):
     
     
     my_label = tk.Label(control_window)
-    my_label.grid(row=2+shared_list.size(), column=1)
+    my_label.grid(row=2+TABLE_VISIBLE_ROWS, column=1)
     
+    cpu_label = tk.Label(control_window)
+    cpu_label.grid(row=2+TABLE_VISIBLE_ROWS, column=3, columnspan=3)
 
 
     entries = []
     data = ["X", "Y", "vx", "vy", "m", "rad"]
+    fields = ["x", "y", "vx", "vy", "mass", "radius"]
     
     
-    rows = BODIES_GEN+1
+    # Only TABLE_VISIBLE_ROWS rows of entries exist, the scrollbar moves them
+    # over the bodies, so the table costs the same with 3 or 3000 bodies
+    rows = TABLE_VISIBLE_ROWS+1
     cols = len(data)
     ideal_cell_width = ((tk_width + 100) // cols) // 10
+    first_body = 0
+
+    shown = {}  # (row, col) -> text currently in the cell
+
+    def body_count():
+        snap = publisher.latest()
+        return 0 if snap is None else len(snap)
 
 
     def set_label_running():
@@ -39,7 +55,7 @@ def settings_window(shared_list):
             #print("Lock is currently busy, skipping acquisition")
             pass
         
-        control_queue.put("paused")
+        control_queue.put(Pause())
         my_label.config(text="SIM PAUSED", bg="red", font=("bold",))
         #print("Paused = ", SIM_PAUSED)
         
@@ -50,32 +66,27 @@ def settings_window(shared_list):
         except RuntimeError:
             #print("Already unlocked")
             pass
-        control_queue.put("resume")
+        control_queue.put(Resume())
         set_label_running()
         #print("Paused = ", SIM_PAUSED)
         
     
     def univ_modified(row, col):
         newdata = entries[row][col].get()
-        print("Modified", row, col, newdata)
-        
-        if(col == 0):
-            shared_list.get(row-1).x = float(newdata)
-            shared_list.get(row-1).clear_trajectory()
-        elif(col == 1):
-            shared_list.get(row-1).y = float(newdata)
-            shared_list.get(row-1).clear_trajectory()
-        elif(col == 2):
-            shared_list.get(row-1).vx = float(newdata)
-        elif(col == 3):
-            shared_list.get(row-1).vy = float(newdata)
-        elif(col == 4):
-            shared_list.get(row-1).mass = float(newdata)
-        elif(col == 5):
-            shared_list.get(row-1).radius = float(newdata)
-        else:
+        shown.pop((row, col), None)  # the cell no longer holds the refreshed text
+        index = first_body + row - 1
+        print("Modified", index, col, newdata)
+
+        if index >= body_count():
+            return
+
+        if col >= len(fields):
             print("BUGED VALUE")
             return
+
+        # The GUI never writes the bodies, the main loop applies the edit
+        # between two physics steps
+        control_queue.put(SetProperty(index, fields[col], float(newdata)))
         
     def settings_mainloop():
         
@@ -109,29 +120,85 @@ def settings_window(shared_list):
         for i in range(cols):
             entries[0][i].insert(0, data[i])
             
-        # Function to update cell value
+        def scroll_to(first):
+            nonlocal first_body
+            last = max(body_count() - TABLE_VISIBLE_ROWS, 0)
+            first_body = min(max(int(first), 0), last)
+            update_scrollbar()
+            update_table()
+
+        def on_scroll(action, amount, unit=None):
+            size = body_count()
+            if action == "moveto":
+                scroll_to(float(amount) * size)
+            elif unit == "pages":
+                scroll_to(first_body + int(amount) * TABLE_VISIBLE_ROWS)
+            else:
+                scroll_to(first_body + int(amount))
+
+        def update_scrollbar():
+            size = max(body_count(), 1)
+            scrollbar.set(first_body / size, min((first_body + TABLE_VISIBLE_ROWS) / size, 1.0))
+
+        scrollbar = tk.Scrollbar(control_window, orient=tk.VERTICAL, command=on_scroll)
+        scrollbar.grid(row=2, column=cols, rowspan=TABLE_VISIBLE_ROWS, sticky="ns")
+        control_window.bind("<MouseWheel>", lambda event: scroll_to(first_body - (1 if event.delta > 0 else -1)))
+        control_window.bind("<Button-4>", lambda event: scroll_to(first_body - 1))
+        control_window.bind("<Button-5>", lambda event: scroll_to(first_body + 1))
+
+        # Function to update cell value, only touching Tk when the text changed
         def update_cell(row, col, value):
+            text = str(value)
+            if shown.get((row, col)) == text:
+                return
+
+            # Do not overwrite a cell the user is typing in
+            if control_window.focus_get() is entries[row][col]:
+                return
+
             entries[row][col].delete(0, tk.END)
-            entries[row][col].insert(0, value)
+            entries[row][col].insert(0, text)
+            shown[(row, col)] = text
             
         def update_table():
             global b
             #print("update table", b)
             #print("Paused = ", SIM_PAUSED)
             
-            row = 1
-
-            for i in range(shared_list.size()):
-                body = shared_list.get(i)
-                tmp = [round(body.x, 0), round(body.y,0), round(body.vx,1), round(body.vy,1), "{:.1e}".format(body.mass), round(body.radius, 1)]
+            # One snapshot for the whole refresh, no lock and no torn rows
+            snap = publisher.latest()
+            size = 0 if snap is None else len(snap)
+
+            for row in range(1, rows):
+                index = first_body + row - 1
+                if index < size:
+                    x, y = snap.pos[index].tolist()
+                    vx, vy = snap.vel[index].tolist()
+                    tmp = [round(x, 0), round(y,0), round(vx,1), round(vy,1), "{:.1e}".format(snap.mass[index]), round(float(snap.rad[index]), 1)]
+                else:
+                    tmp = [""] * cols
                 for col in range(len(tmp)):
                     update_cell(row, col, tmp[col])
-                row +=1
 
-        while not tk_terminate.is_set():
-            tk_terminate.wait(timeout=0.0)
+        # CPU time used by this thread, to show the cost of the panel itself
+        last_cpu = time.thread_time()
+        last_wall = time.perf_counter()
             
+        def update_cpu_meter():
+            nonlocal last_cpu, last_wall
+            cpu = time.thread_time()
+            wall = time.perf_counter()
+            if wall - last_wall >= 1.0:
+                usage = 100 * (cpu - last_cpu) / (wall - last_wall)
+                cpu_label.config(text="GUI thread CPU {:.1f}%".format(usage))
+                thread_usage["Tk"] = usage  # shown by the frame timing HUD
+                last_cpu = cpu
+                last_wall = wall
             
+        def refresh():
+            if tk_terminate.is_set():
+                control_window.quit()
+                return
 
             if not SIM_PAUSED.acquire(blocking=False):
                 #print("Lock is currently busy, skipping acquisition")
@@ -142,13 +209,14 @@ def settings_window(shared_list):
                 SIM_PAUSED.release()
                 #print("Lock released table updated")
 
+            update_scrollbar()
+            update_cpu_meter()
         
+            # Tk sleeps until the next refresh or user event, no busy loop
+            control_window.after(int(1000 / TABLE_REFRESH_HZ), refresh)
             
-            
-            
-
-            control_window.update()
-        
+        refresh()
+        control_window.mainloop()
 
         control_window.destroy()
 
@@ -156,9 +224,9 @@ def settings_window(shared_list):
 
 
 
-def control_thread(shared_list):
+def control_thread(publisher):
     try:
-        settings_window(shared_list)
+        settings_window(publisher)
 
     except Exception as e:  # Catch any exception
         tk_window_copy = shared_tk_window.get()
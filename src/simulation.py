@@ -0,0 +1,49 @@
+from globals import *
+from func import *
+from snapshot import *
+
+
+class Simulation:
+    """
+    Owns the particle store and the collision bookkeeping, and advances the
+    physics one TIMESTEP at a time. Used both by the pygame mainloop and by
+    the headless runner.
+    """
+
+    def __init__(self, bodies, publisher=None):
+        """
+        Args:
+            bodies: The Particles store to advance.
+            publisher: Optional SnapshotPublisher that receives the state
+                after every call to step and after every command.
+        """
+        self.bodies = bodies
+        self.touching = set()  # pairs that bounced and still touch
+        self.step_count = 0
+        self.publisher = publisher
+        self.paused = False  # set by the Pause and Resume commands
+        self.timer = None  # profiling.FrameTimer timing the steps, if any
+        self.publish()
+
+        if PHYSICS_BACKEND == "numba":
+            if jit_kernels.AVAILABLE:
+                jit_kernels.warm_up()
+            else:
+                print("Warning numba is not installed, using the NumPy physics")
+
+    def step(self, n=1):
+        """
+        Runs n physics steps.
+        """
+        for _ in range(n):
+            self.touching = step(self.bodies, self.touching, self.timer)
+            self.step_count += 1
+        self.publish()
+
+    def publish(self):
+        if self.publisher is not None:
+            self.publisher.publish(self.bodies, self.step_count, self.sim_time)
+
+    @property
+    def sim_time(self):
+        return self.step_count * TIMESTEP
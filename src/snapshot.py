@@ -0,0 +1,48 @@
+from globals import *
+
+
+class Snapshot:
+    """
+    Read-only copy of the body state at the end of a physics step.
+
+    The arrays are private copies marked as not writeable, so a reader on
+    another thread can use them for as long as it likes while the
+    simulation keeps running.
+    """
+
+    def __init__(self, bodies, step=0, sim_time=0.0):
+        self.pos = bodies.pos.copy()
+        self.vel = bodies.vel.copy()
+        self.mass = bodies.mass.copy()
+        self.rad = bodies.rad.copy()
+        self.step = step
+        self.sim_time = sim_time
+
+        for array in (self.pos, self.vel, self.mass, self.rad):
+            array.flags.writeable = False
+
+    def __len__(self):
+        return len(self.pos)
+
+
+class SnapshotPublisher:
+    """
+    Hands the latest Snapshot from the simulation thread to the readers.
+
+    publish builds a complete snapshot first and then replaces the single
+    reference readers look at. Rebinding an attribute is atomic in Python,
+    so readers never take a lock and never see half of a step: they get
+    either the previous snapshot or the new one.
+    """
+
+    def __init__(self):
+        self._latest = None
+
+    def publish(self, bodies, step=0, sim_time=0.0):
+        self._latest = Snapshot(bodies, step, sim_time)
+
+    def latest(self):
+        """
+        Returns the most recent snapshot, None before the first publish.
+        """
+        return self._latest
@@ -0,0 +1,226 @@
+from globals import *
+from boundaries import minimum_image, pair_distances
+
+# Neighbouring cells visited from each cell. Only half of the 3x3 block is
+# needed, the other half is found from the opposite side.
+HALF_NEIGHBOURHOOD = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+# Cell coordinates are clamped to this range so the cell keys cannot overflow
+# when a body flies very far away. Clamping only merges far away cells, so it
+# can add candidates but never loses one.
+MAX_CELL = 2**30
+
+
+def ragged_arange(starts, counts):
+    """
+    Concatenates arange(start, start + count) for every (start, count) pair.
+    """
+    total = counts.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def candidate_pairs(pos, rad, cell_size=None, box=None):
+    """
+    Broad phase of the collision detection: bins the bodies in a uniform grid
+    and returns every pair of bodies that sit in the same or in touching cells.
+
+    Args:
+        pos (np.ndarray): (N, 2) positions of the bodies.
+        rad (np.ndarray): (N,) radii of the bodies.
+        cell_size (float): Size of the grid cells, defaults to the largest
+            diameter so overlapping bodies are always in touching cells.
+        box (tuple): (width, height) of the periodic box. The grid then
+            covers the box exactly and the cells on one edge touch the
+            ones on the opposite edge.
+
+    Returns:
+        tuple: Two index arrays (i, k) with i < k, one entry per candidate pair.
+    """
+    n = len(pos)
+    if n < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    if cell_size is None:
+        cell_size = 2 * rad.max()
+    if cell_size <= 0:
+        cell_size = 1.0
+
+    if box is None:
+        grid = None
+        cells = np.floor(pos / cell_size)
+        cells -= cells.min(axis=0)
+        np.clip(cells, 0, MAX_CELL, out=cells)
+        cells = cells.astype(np.int64) + 1  # leave room for the -1 neighbour
+        height = cells[:, 1].max() + 2
+    else:
+        # A whole number of cells, at least cell_size wide, along each side
+        box = np.asarray(box, dtype=np.float64)
+        grid = np.maximum(np.floor(box / cell_size), 1).astype(np.int64)
+        cells = np.floor(pos / (box / grid)).astype(np.int64) % grid
+        height = grid[1]
+
+    keys = cells[:, 0] * height + cells[:, 1]
+
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_cells = cells[order]
+
+    first = []
+    second = []
+    for dx, dy in HALF_NEIGHBOURHOOD:
+        nx = sorted_cells[:, 0] + dx
+        ny = sorted_cells[:, 1] + dy
+        if grid is not None:
+            nx %= grid[0]
+            ny %= grid[1]
+        neighbour = nx * height + ny
+        hi = np.searchsorted(sorted_keys, neighbour, side="right")
+
+        if dx == 0 and dy == 0:
+            # Inside the same cell only pair each body with the ones after it
+            lo = np.arange(1, n + 1)
+        else:
+            lo = np.searchsorted(sorted_keys, neighbour, side="left")
+
+        counts = np.maximum(hi - lo, 0)
+        first.append(np.repeat(np.arange(n), counts))
+        second.append(ragged_arange(lo, counts))
+
+    a = order[np.concatenate(first)]
+    c = order[np.concatenate(second)]
+    i, k = np.minimum(a, c), np.maximum(a, c)
+
+    if grid is not None and (grid < 3).any():
+        # With fewer than three cells across, the neighbours around a cell
+        # wrap onto the same cells more than once
+        key = np.unique(i[i != k] * n + k[i != k])
+        i, k = key // n, key % n
+    return i, k
+
+
+def overlapping_pairs(pos, rad, cell_size=None, box=None):
+    """
+    Broad and narrow phase together: returns the pairs (i, k), i < k, of
+    bodies that overlap or touch (the negation of do_not_overlap), through
+    the nearest image when `box` is given.
+    """
+    i, k = candidate_pairs(pos, rad, cell_size, box)
+    d = pair_distances(pos, i, k, box)
+    hit = d <= rad[i] + rad[k]
+    return i[hit], k[hit]
+
+
+def swept_pairs(start, end, rad, chunk_pairs=GRAVITY_CHUNK_PAIRS, box=None):
+    """
+    Continuous collision detection: finds the pairs of bodies that come into
+    contact while moving in a straight line from `start` to `end`, including
+    the ones that pass through each other and no longer overlap at the end.
+
+    Slow bodies (moving less than their radius) are paired on the uniform
+    grid, with the circles grown to cover their whole move. The few fast
+    ones would blow up the grid cells for everybody, so they are paired
+    with the slow bodies by sweep and prune on x instead (a binary search
+    in the slow bodies sorted by x), and with each other by bounding box.
+    In a periodic box the search on x also looks one box to the left and
+    to the right, and the boxes are compared through the nearest image.
+
+    Args:
+        start (np.ndarray): (N, 2) positions at the beginning of the move.
+        end (np.ndarray): (N, 2) positions at the end of the move.
+        rad (np.ndarray): (N,) radii of the bodies.
+        chunk_pairs (int): Most fast-body pairs tested at once.
+        box (tuple): (width, height) of the periodic box, if any.
+
+    Returns:
+        tuple: (i, k, t), the pairs with i < k and the fraction of the move
+        at which they first touch. Pairs already touching at the start are
+        left to the overlap test.
+    """
+    move = end - start
+    center = (start + end) / 2
+    reach = rad + np.hypot(move[:, 0], move[:, 1]) / 2
+    lo = center - reach[:, None]
+    hi = center + reach[:, None]
+
+    is_fast = reach > 1.5 * rad
+    slow = np.flatnonzero(~is_fast)
+    fast = np.flatnonzero(is_fast)
+
+    a, c = candidate_pairs(center[slow], reach[slow], box=box)
+    first = [slow[a]]
+    second = [slow[c]]
+
+    def add_boxes(f, other):
+        # Keeps the pairs whose bounding boxes overlap
+        dx = center[other, 0] - center[f, 0]
+        dy = center[other, 1] - center[f, 1]
+        if box is not None:
+            minimum_image(dx, box[0])
+            minimum_image(dy, box[1])
+        reach_sum = reach[f] + reach[other]
+        keep = (abs(dx) <= reach_sum) & (abs(dy) <= reach_sum)
+        first.append(f[keep])
+        second.append(other[keep])
+
+    if len(fast) and len(slow):
+        by_x = slow[np.argsort(lo[slow, 0])]
+        sorted_lo = lo[by_x, 0]
+        widest = 2 * reach[slow].max()
+
+        if box is None:
+            shifts = (0.0,)
+        else:
+            # Brings the fast bodies into the box, then looks for the slow
+            # ones also one box to the left and to the right
+            base = box[0] * np.floor(center[fast, 0] / box[0])
+            shifts = (-base - box[0], -base, -base + box[0])
+
+        mark = len(first)
+        for shift in shifts:
+            begin = np.searchsorted(sorted_lo, lo[fast, 0] + shift - widest)
+            counts = np.searchsorted(sorted_lo, hi[fast, 0] + shift, side="right") - begin
+
+            # In chunks of fast bodies holding about chunk_pairs candidates
+            bounds = np.searchsorted(np.cumsum(counts), np.arange(chunk_pairs, counts.sum(), chunk_pairs))
+            for chunk in np.split(np.arange(len(fast)), np.unique(bounds)):
+                add_boxes(np.repeat(fast[chunk], counts[chunk]), by_x[ragged_arange(begin[chunk], counts[chunk])])
+
+        if box is not None:
+            # A fast body crossing most of the box meets the same slow body
+            # in more than one of the shifted searches
+            key = np.unique(np.concatenate(first[mark:]) * len(start) + np.concatenate(second[mark:]))
+            first[mark:] = [key // len(start)]
+            second[mark:] = [key % len(start)]
+
+    rows = max(1, chunk_pairs // max(len(fast), 1))
+    for top in range(0, len(fast), rows):
+        r = np.arange(top, min(top + rows, len(fast)))
+        f, other = np.nonzero(r[:, None] < np.arange(len(fast))[None, :])
+        add_boxes(fast[r[f]], fast[other])
+
+    i = np.concatenate(first)
+    k = np.concatenate(second)
+    i, k = np.minimum(i, k), np.maximum(i, k)
+
+    # |d0 + t dv| = r_i + r_k, the smallest root in [0, 1] of
+    # |dv|^2 t^2 + 2 (d0 . dv) t + |d0|^2 - (r_i + r_k)^2
+    d0 = start[k] - start[i]
+    if box is not None:
+        minimum_image(d0[:, 0], box[0])
+        minimum_image(d0[:, 1], box[1])
+    dv = move[k] - move[i]
+    qa = (dv * dv).sum(axis=1)
+    qb = (d0 * dv).sum(axis=1)
+    qc = (d0 * d0).sum(axis=1) - (rad[i] + rad[k]) ** 2
+    disc = qb * qb - qa * qc
+
+    # Apart at the start, approaching and on a path that meets
+    hit = (qc > 0) & (qb < 0) & (disc >= 0)
+    i = i[hit]
+    k = k[hit]
+    # Same root as (-b - sqrt(disc)) / a, without the cancellation
+    t = qc[hit] / (-qb[hit] + np.sqrt(disc[hit]))
+
+    inside = t <= 1
+    return i[inside], k[inside], t[inside]
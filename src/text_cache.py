@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+import pygame
+
+from globals import *
+
+_fonts = {}
+
+
+def get_font(size=32):
+    """
+    Returns the default pygame font at the given size. Fonts are created on
+    first use and shared by every caller, so no code path builds its own.
+    """
+    if size not in _fonts:
+        pygame.font.init()
+        _fonts[size] = pygame.font.Font(None, size)
+    return _fonts[size]
+
+
+class TextCache:
+    """
+    LRU cache of rendered text surfaces, keyed by the string and its style.
+
+    Most labels repeat from frame to frame: the axis numbers never change and
+    a velocity label only changes when its one-decimal text does, so most
+    frames only blit surfaces that were already rendered.
+    """
+
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, color=WHITE, size=32, antialias=True):
+        """
+        Returns the surface of `text`, rendering it only on a cache miss.
+        """
+        key = (text, tuple(color), size, antialias)
+        surface = self._surfaces.get(key)
+
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = get_font(size).render(text, antialias, color)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()  # display format blits faster
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+
+_text_cache = None
+
+
+def get_text_cache():
+    """
+    Returns the TextCache shared by the whole renderer.
+    """
+    global _text_cache
+    if _text_cache is None:
+        _text_cache = TextCache()
+    return _text_cache
+